@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+from typing import Dict, Tuple
+
+import pygame
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+CACHE_DIR = os.environ.get("PYCHESS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "pychess"))
+PIECE_NAMES = ('wP', 'wR', 'wN', 'wB', 'wK', 'wQ', 'bP', 'bR', 'bN', 'bB', 'bK', 'bQ')
+ATLAS_VERSION = 1
+
+# Sprites are scaled to SPRITE_SCALE squares, centred on their square and raised by
+# these offsets (in pixels at an 80 px square, scaled with the square size)
+SPRITE_SCALE = 2.2
+PIECE_OFFSETS = {
+    'P': 30,  # Pion
+    'R': 30,   # Tour
+    'N': 30,   # Cavalier
+    'B': 35,   # Fou
+    'Q': 30,   # Reine
+    'K': 40    # Roi
+}
+
+
+# All twelve piece sprites on one surface, each trimmed to its visible pixels. For every
+# piece, `sources` is its area in the atlas and `offsets` is where that area goes relative
+# to the top-left corner of the piece's square.
+class SpriteAtlas:
+    def __init__(self, surface: pygame.Surface, sources: Dict[str, pygame.Rect],
+                 offsets: Dict[str, Tuple[int, int]]):
+        self.surface = surface
+        self.sources = sources
+        self.offsets = offsets
+
+    def dest(self, piece: str, x: int, y: int) -> pygame.Rect:
+        # Screen area covered by the piece on the square whose corner is (x, y)
+        dx, dy = self.offsets[piece]
+        return pygame.Rect(x + dx, y + dy, self.sources[piece].width, self.sources[piece].height)
+
+
+def atlas_key(sq_size: int) -> str:
+    # Changes whenever a source image or the layout parameters do
+    digest = hashlib.sha1(f"{ATLAS_VERSION}:{sq_size}:{SPRITE_SCALE}:{sorted(PIECE_OFFSETS.items())}".encode())
+    for piece in PIECE_NAMES:
+        stat = os.stat(os.path.join(IMAGE_DIR, piece + ".png"))
+        digest.update(f"{piece}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def build_atlas(sq_size: int) -> Tuple[pygame.Surface, Dict[str, pygame.Rect], Dict[str, Tuple[int, int]]]:
+    size = int(sq_size * SPRITE_SCALE)
+    crops = {}
+    offsets = {}
+    for piece in PIECE_NAMES:
+        image = pygame.transform.scale(pygame.image.load(os.path.join(IMAGE_DIR, piece + ".png")), (size, size))
+        bounds = image.get_bounding_rect()
+        crops[piece] = image.subsurface(bounds)
+        rect = image.get_rect(center=(sq_size // 2, sq_size // 2 - PIECE_OFFSETS[piece[1]] * sq_size // 80))
+        offsets[piece] = (rect.x + bounds.x, rect.y + bounds.y)
+    surface = pygame.Surface((sum(crop.get_width() for crop in crops.values()),
+                              max(crop.get_height() for crop in crops.values())), pygame.SRCALPHA)
+    sources = {}
+    x = 0
+    for piece, crop in crops.items():
+        # MAX onto a transparent surface copies the pixels exactly, alpha included
+        surface.blit(crop, (x, 0), special_flags=pygame.BLEND_RGBA_MAX)
+        sources[piece] = pygame.Rect(x, 0, crop.get_width(), crop.get_height())
+        x += crop.get_width()
+    return surface, sources, offsets
+
+
+def load_atlas(sq_size: int) -> SpriteAtlas:
+    # Reuse the atlas cached for this square size, rebuilding it when the images changed.
+    # A cache directory that cannot be written only costs the rebuild next time.
+    key = atlas_key(sq_size)
+    image_path = os.path.join(CACHE_DIR, f"atlas-{sq_size}.png")
+    meta_path = os.path.join(CACHE_DIR, f"atlas-{sq_size}.json")
+    surface = None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta["key"] == key:
+            surface = pygame.image.load(image_path)
+            sources = {piece: pygame.Rect(rect) for piece, rect in meta["sources"].items()}
+            offsets = {piece: tuple(offset) for piece, offset in meta["offsets"].items()}
+    except (OSError, ValueError, KeyError, pygame.error):
+        surface = None
+    if surface is None:
+        surface, sources, offsets = build_atlas(sq_size)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            pygame.image.save(surface, image_path)
+            with open(meta_path, "w") as f:
+                json.dump({"key": key, "sources": {piece: list(rect) for piece, rect in sources.items()},
+                           "offsets": offsets}, f)
+        except (OSError, pygame.error):
+            pass
+    if pygame.display.get_surface() is not None:
+        surface = surface.convert_alpha()
+    return SpriteAtlas(surface, sources, offsets)
@@ -1,6 +1,115 @@
+import random
 from dataclasses import dataclass
 
 
+# Bitboards: bit (row * 8 + col) is set when the square is occupied, row 0 being rank 8.
+FULL_BOARD = (1 << 64) - 1
+SQUARE_BB = tuple(1 << sq for sq in range(64))
+PIECE_CODES = ('wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK')
+PROMOTION_RANKS = 0xFF | (0xFF << 56)
+PROMOTION_CHOICES = ('Q', 'R', 'B', 'N')
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Castling rights are a 4-bit set; a move clears the rights tied to the squares it touches.
+WKS, WQS, BKS, BQS = 1, 2, 4, 8
+ALL_CASTLING_RIGHTS = WKS | WQS | BKS | BQS
+CASTLING_MASKS = tuple(
+    ALL_CASTLING_RIGHTS & ~{0: BQS, 4: BKS | BQS, 7: BKS, 56: WQS, 60: WKS | WQS, 63: WKS}.get(sq, 0)
+    for sq in range(64)
+)
+
+
+def _leaper_attacks(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                bb |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(bb)
+    return tuple(table)
+
+
+def _ray(dr, dc):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        r, c = r + dr, c + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            bb |= 1 << (r * 8 + c)
+            r, c = r + dr, c + dc
+        table.append(bb)
+    return tuple(table)
+
+
+KNIGHT_ATTACKS = _leaper_attacks(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = _leaper_attacks(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+PAWN_ATTACKS = {'w': _leaper_attacks(((-1, -1), (-1, 1))), 'b': _leaper_attacks(((1, -1), (1, 1)))}
+
+
+def _between():
+    table = []
+    for a in range(64):
+        ar, ac = divmod(a, 8)
+        row = []
+        for b in range(64):
+            br, bc = divmod(b, 8)
+            dr, dc = br - ar, bc - ac
+            bb = 0
+            if a != b and (dr == 0 or dc == 0 or abs(dr) == abs(dc)):
+                step_r = (dr > 0) - (dr < 0)
+                step_c = (dc > 0) - (dc < 0)
+                r, c = ar + step_r, ac + step_c
+                while (r, c) != (br, bc):
+                    bb |= 1 << (r * 8 + c)
+                    r, c = r + step_r, c + step_c
+            row.append(bb)
+        table.append(tuple(row))
+    return tuple(table)
+
+
+BETWEEN = _between()
+
+# (direction, increasing, rays): increasing rays run towards higher square indices,
+# so their nearest blocker is the lowest set bit, otherwise the highest one.
+ROOK_RAYS = (((-1, 0), False, _ray(-1, 0)), ((0, -1), False, _ray(0, -1)),
+             ((1, 0), True, _ray(1, 0)), ((0, 1), True, _ray(0, 1)))
+BISHOP_RAYS = (((-1, -1), False, _ray(-1, -1)), ((-1, 1), False, _ray(-1, 1)),
+               ((1, -1), True, _ray(1, -1)), ((1, 1), True, _ray(1, 1)))
+
+ROOK_LINES = tuple(sum(ray_table[sq] for _, _, ray_table in ROOK_RAYS) for sq in range(64))
+BISHOP_LINES = tuple(sum(ray_table[sq] for _, _, ray_table in BISHOP_RAYS) for sq in range(64))
+
+# Zobrist keys come from a fixed seed so hashes are stable across processes and runs.
+_zobrist_rng = random.Random(0x5EED_C4E55)
+ZOBRIST_PIECES = {piece: tuple(_zobrist_rng.getrandbits(64) for _ in range(64)) for piece in PIECE_CODES}
+_ZOBRIST_RIGHTS = tuple(_zobrist_rng.getrandbits(64) for _ in range(4))
+ZOBRIST_CASTLING = tuple(
+    (_ZOBRIST_RIGHTS[0] if bits & WKS else 0) ^ (_ZOBRIST_RIGHTS[1] if bits & WQS else 0)
+    ^ (_ZOBRIST_RIGHTS[2] if bits & BKS else 0) ^ (_ZOBRIST_RIGHTS[3] if bits & BQS else 0)
+    for bits in range(16)
+)
+ZOBRIST_ENPASSANT = tuple(_zobrist_rng.getrandbits(64) for _ in range(8))
+ZOBRIST_BLACK_TO_MOVE = _zobrist_rng.getrandbits(64)
+
+
+def slider_attacks(sq, occupied, rays):
+    attacks = 0
+    for _, increasing, ray_table in rays:
+        ray = ray_table[sq]
+        blockers = ray & occupied
+        if blockers:
+            if increasing:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= ray_table[blocker]
+        attacks |= ray
+    return attacks
+
+
 class CastleRights:
     def __init__(self, wks, bks, wqs, bqs):
         self.wks = wks
@@ -10,6 +119,10 @@ class CastleRights:
 
 
 class Move:
+    __slots__ = ('start_row', 'start_col', 'end_row', 'end_col', 'piece_moved', 'piece_captured',
+                 'is_pawn_promotion', 'promotion_choice', 'is_enpassant_move', 'is_castle_move',
+                 'is_capture', 'move_id')
+
     ranks_to_rows = {"1": 7, "2": 6, "3": 5, "4": 4,
                      "5": 3, "6": 2, "7": 1, "8": 0}
     rows_to_ranks = {v: k for k, v in ranks_to_rows.items()}
@@ -17,32 +130,45 @@ class Move:
                      "e": 4, "f": 5, "g": 6, "h": 7}
     cols_to_files = {v: k for k, v in files_to_cols.items()}
 
-    def __init__(self, start_sq, end_sq, board, is_enpassant_move=False, is_castle_move=False):
-        self.start_row = start_sq[0]
-        self.start_col = start_sq[1]
-        self.end_row = end_sq[0]
-        self.end_col = end_sq[1]
-        self.piece_moved = board[self.start_row][self.start_col]
-        self.piece_captured = board[self.end_row][self.end_col]
-        self.is_pawn_promotion = (self.piece_moved == 'wP' and self.end_row == 0) or (self.piece_moved == 'bP' and self.end_row == 7)
+    def __init__(self, start_sq, end_sq, board, is_enpassant_move=False, is_castle_move=False, promotion_choice='Q'):
+        self.start_row, self.start_col = start_row, start_col = start_sq
+        self.end_row, self.end_col = end_row, end_col = end_sq
+        self.piece_moved = piece_moved = board[start_row][start_col]
+        if is_enpassant_move:
+            piece_captured = 'wP' if piece_moved == 'bP' else 'bP'
+        else:
+            piece_captured = board[end_row][end_col]
+        self.piece_captured = piece_captured
+        self.is_pawn_promotion = (piece_moved == 'wP' and end_row == 0) or (piece_moved == 'bP' and end_row == 7)
+        self.promotion_choice = promotion_choice
         self.is_enpassant_move = is_enpassant_move
-        if self.is_enpassant_move:
-            self.piece_captured = 'wP' if self.piece_moved == 'bP' else 'bP'
         self.is_castle_move = is_castle_move
-        self.is_capture = self.piece_captured != '--'
-        self.move_id = self.start_row * 1000 + self.start_col * 100 + self.end_row * 10 + self.end_col
+        self.is_capture = piece_captured != '--'
+        self.move_id = start_row * 1000 + start_col * 100 + end_row * 10 + end_col
 
     def __eq__(self, other):
         if isinstance(other, Move):
             return self.move_id == other.move_id
         return False
 
+    def __hash__(self):
+        return self.move_id
+
     def get_chess_notation(self):
-        return self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col)
+        notation = self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col)
+        if self.is_pawn_promotion:
+            notation += self.promotion_choice.lower()
+        return notation
 
     def get_rank_file(self, r, c):
         return self.cols_to_files[c] + self.rows_to_ranks[r]
 
+    def to_code(self):
+        # 16-bit form: start square, end square, then the promotion piece (0 = queen or none).
+        promotion = PROMOTION_CHOICES.index(self.promotion_choice) if self.is_pawn_promotion else 0
+        return ((self.start_row * 8 + self.start_col) | (self.end_row * 8 + self.end_col) << 6
+                | promotion << 12)
+
 
 class GameState:
     def __init__(self):
@@ -66,111 +192,330 @@ class GameState:
         self.pins = []
         self.checks = []
         self.enpassant_possible = ()
-        self.current_castling_rights = CastleRights(True, True, True, True)
-        self.castle_rights_log = [CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                               self.current_castling_rights.wqs, self.current_castling_rights.bqs)]
+        self.castling_rights = ALL_CASTLING_RIGHTS
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        # One entry per move in move_log: (castling_rights, enpassant_possible, piece_captured,
+        # halfmove_clock, zobrist_key) as they were before the move.
+        self.history = []
+        self.bitboards = {}
+        self.occupancy = {}
+        self.sync_bitboards()
+        self.zobrist_key = self.compute_zobrist_key()
+
+    @property
+    def current_castling_rights(self):
+        rights = self.castling_rights
+        return CastleRights(bool(rights & WKS), bool(rights & BKS), bool(rights & WQS), bool(rights & BQS))
+
+    @classmethod
+    def from_fen(cls, fen):
+        fields = fen.split()
+        if len(fields) < 2 or fields[1] not in ('w', 'b'):
+            raise ValueError(f"Invalid FEN: {fen!r}")
+        ranks = fields[0].split('/')
+        if len(ranks) != 8:
+            raise ValueError(f"Invalid FEN board: {fields[0]!r}")
+        board = []
+        for rank in ranks:
+            row = []
+            for ch in rank:
+                if ch.isdigit():
+                    row.extend(["--"] * int(ch))
+                elif ch.upper() in "PNBRQK":
+                    row.append(('w' if ch.isupper() else 'b') + ch.upper())
+                else:
+                    raise ValueError(f"Invalid FEN piece: {ch!r}")
+            if len(row) != 8:
+                raise ValueError(f"Invalid FEN rank: {rank!r}")
+            board.append(row)
+        kings = [(board[r][c], (r, c)) for r in range(8) for c in range(8) if board[r][c][1] == 'K']
+        king_locations = dict(kings)
+        if len(kings) != 2 or len(king_locations) != 2:
+            raise ValueError(f"FEN must have exactly one king per side: {fen!r}")
+        if any(piece[1] == 'P' for piece in board[0] + board[7]):
+            raise ValueError(f"FEN has a pawn on the first or eighth rank: {fen!r}")
+
+        gs = cls()
+        gs.board = board
+        gs.white_king_location = king_locations['wK']
+        gs.black_king_location = king_locations['bK']
+        gs.white_to_move = fields[1] == 'w'
+        castling = fields[2] if len(fields) > 2 else '-'
+        rights = (('K' in castling and WKS) | ('Q' in castling and WQS)
+                  | ('k' in castling and BKS) | ('q' in castling and BQS))
+        # Keep only the rights whose king and rook are still on their home squares
+        for bit, (kr, kc, king), (rr, rc, rook) in ((WKS, (7, 4, 'wK'), (7, 7, 'wR')), (WQS, (7, 4, 'wK'), (7, 0, 'wR')),
+                                                    (BKS, (0, 4, 'bK'), (0, 7, 'bR')), (BQS, (0, 4, 'bK'), (0, 0, 'bR'))):
+            if board[kr][kc] != king or board[rr][rc] != rook:
+                rights &= ~bit
+        gs.castling_rights = rights
+        ep = fields[3] if len(fields) > 3 else '-'
+        if ep != '-':
+            # The pawn that just moved two squares belongs to the side not to move
+            if len(ep) != 2 or ep[0] not in Move.files_to_cols or ep[1] != ('6' if gs.white_to_move else '3'):
+                raise ValueError(f"Invalid FEN en passant square: {ep!r}")
+            gs.enpassant_possible = (Move.ranks_to_rows[ep[1]], Move.files_to_cols[ep[0]])
+        try:
+            gs.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            gs.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"Invalid FEN move counters: {fen!r}") from None
+        if gs.halfmove_clock < 0 or gs.fullmove_number < 1:
+            raise ValueError(f"Invalid FEN move counters: {fen!r}")
+        gs.sync_bitboards()
+        # The side to move could take the other king
+        mover, waiting = ('w', 'b') if gs.white_to_move else ('b', 'w')
+        if gs.is_square_attacked(gs.bitboards[waiting + 'K'].bit_length() - 1, mover):
+            raise ValueError(f"FEN leaves the side not to move in check: {fen!r}")
+        gs.zobrist_key = gs.compute_zobrist_key()
+        gs.in_check = gs.check_for_check()
+        return gs
+
+    def to_fen(self):
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1] if piece[0] == 'w' else piece[1].lower()
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        rights = self.castling_rights
+        castling = (('K' if rights & WKS else '') + ('Q' if rights & WQS else '')
+                    + ('k' if rights & BKS else '') + ('q' if rights & BQS else '')) or '-'
+        ep = '-'
+        if self.enpassant_possible:
+            ep = Move.cols_to_files[self.enpassant_possible[1]] + Move.rows_to_ranks[self.enpassant_possible[0]]
+        return " ".join(("/".join(ranks), 'w' if self.white_to_move else 'b', castling, ep,
+                         str(self.halfmove_clock), str(self.fullmove_number)))
+
+    def sync_bitboards(self):
+        self.bitboards = {piece: 0 for piece in PIECE_CODES}
+        self.occupancy = {'w': 0, 'b': 0}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != '--':
+                    self.bitboards[piece] |= SQUARE_BB[r * 8 + c]
+                    self.occupancy[piece[0]] |= SQUARE_BB[r * 8 + c]
+
+    def compute_zobrist_key(self):
+        key = 0
+        for piece, bb in self.bitboards.items():
+            keys = ZOBRIST_PIECES[piece]
+            while bb:
+                low = bb & -bb
+                key ^= keys[low.bit_length() - 1]
+                bb ^= low
+        if not self.white_to_move:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key ^ ZOBRIST_CASTLING[self.castling_rights] ^ self.enpassant_zobrist()
+
+    def enpassant_zobrist(self):
+        # The en passant file is only part of the key when a pawn can actually capture there,
+        # so transpositions that differ only by a dead en passant square hash the same.
+        if not self.enpassant_possible:
+            return 0
+        ep_r, ep_c = self.enpassant_possible
+        if self.white_to_move:
+            capturers = PAWN_ATTACKS['b'][ep_r * 8 + ep_c] & self.bitboards['wP']
+        else:
+            capturers = PAWN_ATTACKS['w'][ep_r * 8 + ep_c] & self.bitboards['bP']
+        return ZOBRIST_ENPASSANT[ep_c] if capturers else 0
+
+    def trim_history(self, keep):
+        # Forget all but the last `keep` moves, which can then no longer be undone.
+        # Returns how many were dropped.
+        excess = len(self.move_log) - keep
+        if excess <= 0:
+            return 0
+        del self.move_log[:excess]
+        del self.history[:excess]
+        return excess
 
     def make_move(self, move):
-        self.board[move.start_row][move.start_col] = "--"
-        self.board[move.end_row][move.end_col] = move.piece_moved
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        board = self.board
+        start_sq = move.start_row * 8 + move.start_col
+        end_sq = move.end_row * 8 + move.end_col
+        start_bb = SQUARE_BB[start_sq]
+        end_bb = SQUARE_BB[end_sq]
+        piece_moved = move.piece_moved
+        piece_captured = move.piece_captured
+        color = piece_moved[0]
+        enemy = 'b' if color == 'w' else 'w'
+        self.history.append((self.castling_rights, self.enpassant_possible, piece_captured,
+                             self.halfmove_clock, self.zobrist_key))
+        key = (self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE ^ self.enpassant_zobrist()
+               ^ ZOBRIST_CASTLING[self.castling_rights])
+        if move.is_enpassant_move:
+            captured_sq = move.start_row * 8 + move.end_col
+            bitboards[piece_captured] ^= SQUARE_BB[captured_sq]
+            occupancy[enemy] ^= SQUARE_BB[captured_sq]
+            key ^= ZOBRIST_PIECES[piece_captured][captured_sq]
+            board[move.start_row][move.end_col] = "--"
+        elif piece_captured != '--':
+            bitboards[piece_captured] ^= end_bb
+            occupancy[enemy] ^= end_bb
+            key ^= ZOBRIST_PIECES[piece_captured][end_sq]
+        bitboards[piece_moved] ^= start_bb | end_bb
+        occupancy[color] ^= start_bb | end_bb
+        key ^= ZOBRIST_PIECES[piece_moved][start_sq] ^ ZOBRIST_PIECES[piece_moved][end_sq]
+
+        board[move.start_row][move.start_col] = "--"
+        board[move.end_row][move.end_col] = piece_moved
         self.move_log.append(move)
         self.white_to_move = not self.white_to_move
-        if move.piece_moved == 'wK':
+        if piece_moved == 'wK':
             self.white_king_location = (move.end_row, move.end_col)
-        elif move.piece_moved == 'bK':
+        elif piece_moved == 'bK':
             self.black_king_location = (move.end_row, move.end_col)
 
         if move.is_pawn_promotion:
-            self.board[move.end_row][move.end_col] = move.piece_moved[0] + 'Q'
-
-        if move.is_enpassant_move:
-            self.board[move.start_row][move.end_col] = "--"
+            promoted = color + move.promotion_choice
+            board[move.end_row][move.end_col] = promoted
+            bitboards[piece_moved] ^= end_bb
+            bitboards[promoted] |= end_bb
+            key ^= ZOBRIST_PIECES[piece_moved][end_sq] ^ ZOBRIST_PIECES[promoted][end_sq]
 
-        if move.piece_moved[1] == 'P' and abs(move.start_row - move.end_row) == 2:
+        if piece_moved[1] == 'P' and abs(move.start_row - move.end_row) == 2:
             self.enpassant_possible = ((move.start_row + move.end_row) // 2, move.start_col)
         else:
             self.enpassant_possible = ()
+        if piece_moved[1] == 'P' or move.is_capture:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if color == 'b':
+            self.fullmove_number += 1
 
         if move.is_castle_move:
             if move.end_col - move.start_col == 2:
-                self.board[move.end_row][move.end_col - 1] = self.board[move.end_row][move.end_col + 1]
-                self.board[move.end_row][move.end_col + 1] = '--'
+                rook_from, rook_to = end_sq + 1, end_sq - 1
             else:
-                self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 2]
-                self.board[move.end_row][move.end_col - 2] = '--'
+                rook_from, rook_to = end_sq - 2, end_sq + 1
+            board[rook_to >> 3][rook_to & 7] = board[rook_from >> 3][rook_from & 7]
+            board[rook_from >> 3][rook_from & 7] = '--'
+            rook_bb = SQUARE_BB[rook_from] | SQUARE_BB[rook_to]
+            bitboards[color + 'R'] ^= rook_bb
+            occupancy[color] ^= rook_bb
+            key ^= ZOBRIST_PIECES[color + 'R'][rook_from] ^ ZOBRIST_PIECES[color + 'R'][rook_to]
 
         self.update_castle_rights(move)
         self.in_check = self.check_for_check()
-        self.castle_rights_log.append(CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                                   self.current_castling_rights.wqs, self.current_castling_rights.bqs))
+        self.zobrist_key = key ^ ZOBRIST_CASTLING[self.castling_rights] ^ self.enpassant_zobrist()
 
     def check_for_check(self):
-        if self.white_to_move:
-            return self.square_under_attack(self.white_king_location[0], self.white_king_location[1])
-        else:
-            return self.square_under_attack(self.black_king_location[0], self.black_king_location[1])
+        color, enemy = ('w', 'b') if self.white_to_move else ('b', 'w')
+        return self.is_square_attacked(self.bitboards[color + 'K'].bit_length() - 1, enemy)
 
     def undo_move(self):
         if len(self.move_log) != 0:
             move = self.move_log.pop()
-            self.board[move.start_row][move.start_col] = move.piece_moved
-            self.board[move.end_row][move.end_col] = move.piece_captured
+            (self.castling_rights, self.enpassant_possible, piece_captured,
+             self.halfmove_clock, self.zobrist_key) = self.history.pop()
+            bitboards = self.bitboards
+            occupancy = self.occupancy
+            board = self.board
+            start_sq = move.start_row * 8 + move.start_col
+            end_sq = move.end_row * 8 + move.end_col
+            start_bb = SQUARE_BB[start_sq]
+            end_bb = SQUARE_BB[end_sq]
+            piece_moved = move.piece_moved
+            color = piece_moved[0]
+            enemy = 'b' if color == 'w' else 'w'
+            if move.is_pawn_promotion:
+                bitboards[color + move.promotion_choice] ^= end_bb
+                bitboards[piece_moved] |= end_bb
+            bitboards[piece_moved] ^= start_bb | end_bb
+            occupancy[color] ^= start_bb | end_bb
+            board[move.start_row][move.start_col] = piece_moved
+            if move.is_enpassant_move:
+                captured_bb = SQUARE_BB[move.start_row * 8 + move.end_col]
+                bitboards[piece_captured] |= captured_bb
+                occupancy[enemy] |= captured_bb
+                board[move.end_row][move.end_col] = "--"
+                board[move.start_row][move.end_col] = piece_captured
+            else:
+                if piece_captured != '--':
+                    bitboards[piece_captured] |= end_bb
+                    occupancy[enemy] |= end_bb
+                board[move.end_row][move.end_col] = piece_captured
+
             self.white_to_move = not self.white_to_move
-            if move.piece_moved == 'wK':
+            if piece_moved == 'wK':
                 self.white_king_location = (move.start_row, move.start_col)
-            elif move.piece_moved == 'bK':
+            elif piece_moved == 'bK':
                 self.black_king_location = (move.start_row, move.start_col)
-            if move.is_enpassant_move:
-                self.board[move.end_row][move.end_col] = "--"
-                self.board[move.start_row][move.end_col] = move.piece_captured
-                self.enpassant_possible = (move.end_row, move.end_col)
-            if move.piece_moved[1] == 'P' and abs(move.start_row - move.end_row) == 2:
-                self.enpassant_possible = ()
-            self.castle_rights_log.pop()
-            new_rights = self.castle_rights_log[-1]
-            self.current_castling_rights = CastleRights(new_rights.wks, new_rights.bks, new_rights.wqs, new_rights.bqs)
+            if color == 'b':
+                self.fullmove_number -= 1
             if move.is_castle_move:
                 if move.end_col - move.start_col == 2:
-                    self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 1]
-                    self.board[move.end_row][move.end_col - 1] = '--'
+                    rook_from, rook_to = end_sq + 1, end_sq - 1
                 else:
-                    self.board[move.end_row][move.end_col - 2] = self.board[move.end_row][move.end_col + 1]
-                    self.board[move.end_row][move.end_col + 1] = '--'
+                    rook_from, rook_to = end_sq - 2, end_sq + 1
+                board[rook_from >> 3][rook_from & 7] = board[rook_to >> 3][rook_to & 7]
+                board[rook_to >> 3][rook_to & 7] = '--'
+                rook_bb = SQUARE_BB[rook_from] | SQUARE_BB[rook_to]
+                bitboards[color + 'R'] ^= rook_bb
+                occupancy[color] ^= rook_bb
             self.checkmate = False
             self.stalemate = False
 
     def update_castle_rights(self, move):
-        if move.piece_moved == 'wK':
-            self.current_castling_rights.wks = False
-            self.current_castling_rights.wqs = False
-        elif move.piece_moved == 'bK':
-            self.current_castling_rights.bks = False
-            self.current_castling_rights.bqs = False
-        elif move.piece_moved == 'wR':
-            if move.start_row == 7:
-                if move.start_col == 0:
-                    self.current_castling_rights.wqs = False
-                elif move.start_col == 7:
-                    self.current_castling_rights.wks = False
-        elif move.piece_moved == 'bR':
-            if move.start_row == 0:
-                if move.start_col == 0:
-                    self.current_castling_rights.bqs = False
-                elif move.start_col == 7:
-                    self.current_castling_rights.bks = False
+        self.castling_rights &= (CASTLING_MASKS[move.start_row * 8 + move.start_col]
+                                 & CASTLING_MASKS[move.end_row * 8 + move.end_col])
 
     def get_valid_moves(self):
-        temp_enpassant_possible = self.enpassant_possible
-        temp_castle_rights = CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                        self.current_castling_rights.wqs, self.current_castling_rights.bqs)
-        moves = self.get_all_possible_moves()
-        for i in range(len(moves) - 1, -1, -1):
-            self.make_move(moves[i])
-            self.white_to_move = not self.white_to_move
-            if self.check_for_check():
-                moves.remove(moves[i])
-            self.white_to_move = not self.white_to_move
-            self.undo_move()
+        moves = []
+        color, enemy = ('w', 'b') if self.white_to_move else ('b', 'w')
+        bitboards = self.bitboards
+        own = self.occupancy[color]
+        occupied = own | self.occupancy[enemy]
+        king_sq = bitboards[color + 'K'].bit_length() - 1
+        king_r, king_c = king_sq >> 3, king_sq & 7
+        checkers, pin_masks = self.check_for_pins_and_checks()
+        self.in_check = checkers != 0
+
+        danger = self.attacked_squares(enemy, occupied ^ SQUARE_BB[king_sq])
+        self.add_moves(king_r, king_c, KING_ATTACKS[king_sq] & ~own & ~danger, moves)
+
+        # In double check only the king may move.
+        if not checkers & (checkers - 1):
+            if checkers:
+                target_mask = (checkers | BETWEEN[king_sq][checkers.bit_length() - 1]) & ~own
+            else:
+                target_mask = ~own & FULL_BOARD
+            self.get_legal_pawn_moves(color, enemy, target_mask, pin_masks, moves)
+            knights = bitboards[color + 'N']
+            while knights:
+                low = knights & -knights
+                sq = low.bit_length() - 1
+                if sq not in pin_masks:
+                    self.add_moves(sq >> 3, sq & 7, KNIGHT_ATTACKS[sq] & target_mask, moves)
+                knights ^= low
+            for piece, rays in (('B', BISHOP_RAYS), ('R', ROOK_RAYS)):
+                sliders = bitboards[color + piece] | bitboards[color + 'Q']
+                while sliders:
+                    low = sliders & -sliders
+                    sq = low.bit_length() - 1
+                    targets = slider_attacks(sq, occupied, rays) & target_mask
+                    if sq in pin_masks:
+                        targets &= pin_masks[sq]
+                    self.add_moves(sq >> 3, sq & 7, targets, moves)
+                    sliders ^= low
+            if not checkers:
+                self.get_castle_moves(king_r, king_c, moves)
+
         if len(moves) == 0:
             if self.in_check:
                 self.checkmate = True
@@ -179,148 +524,230 @@ class GameState:
         else:
             self.checkmate = False
             self.stalemate = False
-
-        if self.white_to_move:
-            self.get_castle_moves(self.white_king_location[0], self.white_king_location[1], moves)
-        else:
-            self.get_castle_moves(self.black_king_location[0], self.black_king_location[1], moves)
-
-        self.enpassant_possible = temp_enpassant_possible
-        self.current_castling_rights = temp_castle_rights
         return moves
 
+    def check_for_pins_and_checks(self):
+        color, enemy = ('w', 'b') if self.white_to_move else ('b', 'w')
+        bitboards = self.bitboards
+        own = self.occupancy[color]
+        occupied = own | self.occupancy[enemy]
+        king_sq = bitboards[color + 'K'].bit_length() - 1
+        king_r, king_c = king_sq >> 3, king_sq & 7
+        checkers = (KNIGHT_ATTACKS[king_sq] & bitboards[enemy + 'N']) | (PAWN_ATTACKS[color][king_sq] & bitboards[enemy + 'P'])
+        pin_masks = {}
+        self.pins = []
+        self.checks = []
+        snipers = ((ROOK_LINES[king_sq] & (bitboards[enemy + 'R'] | bitboards[enemy + 'Q']))
+                   | (BISHOP_LINES[king_sq] & (bitboards[enemy + 'B'] | bitboards[enemy + 'Q'])))
+        while snipers:
+            low = snipers & -snipers
+            sq = low.bit_length() - 1
+            snipers ^= low
+            between = BETWEEN[king_sq][sq]
+            blockers = between & occupied
+            r, c = sq >> 3, sq & 7
+            direction = ((r > king_r) - (r < king_r), (c > king_c) - (c < king_c))
+            if not blockers:
+                checkers |= low
+            elif not blockers & (blockers - 1) and blockers & own:
+                pinned_sq = blockers.bit_length() - 1
+                pin_masks[pinned_sq] = between | low
+                self.pins.append((pinned_sq >> 3, pinned_sq & 7) + direction)
+        remaining = checkers
+        while remaining:
+            low = remaining & -remaining
+            sq = low.bit_length() - 1
+            remaining ^= low
+            r, c = sq >> 3, sq & 7
+            if BETWEEN[king_sq][sq] or KING_ATTACKS[king_sq] & low:
+                self.checks.append((r, c, (r > king_r) - (r < king_r), (c > king_c) - (c < king_c)))
+            else:
+                self.checks.append((r, c, r - king_r, c - king_c))
+        return checkers, pin_masks
+
+    def get_legal_pawn_moves(self, color, enemy, target_mask, pin_masks, moves):
+        board = self.board
+        own = self.occupancy[color]
+        enemy_occupancy = self.occupancy[enemy]
+        empty = ~(own | enemy_occupancy)
+        step, start_row = (-8, 6) if color == 'w' else (8, 1)
+        pawn_attacks = PAWN_ATTACKS[color]
+        ep_bb = 0
+        if self.enpassant_possible:
+            ep_bb = SQUARE_BB[self.enpassant_possible[0] * 8 + self.enpassant_possible[1]]
+        pawns = self.bitboards[color + 'P']
+        while pawns:
+            low = pawns & -pawns
+            sq = low.bit_length() - 1
+            pawns ^= low
+            r, c = sq >> 3, sq & 7
+            mask = target_mask & pin_masks.get(sq, FULL_BOARD)
+            targets = pawn_attacks[sq] & enemy_occupancy
+            one = sq + step
+            if empty & SQUARE_BB[one]:
+                targets |= SQUARE_BB[one]
+                if r == start_row:
+                    targets |= empty & SQUARE_BB[one + step]
+            self.add_pawn_moves(r, c, targets & mask, moves)
+            if pawn_attacks[sq] & ep_bb and self.enpassant_is_legal(color, enemy, sq):
+                moves.append(Move((r, c), self.enpassant_possible, board, is_enpassant_move=True))
+
+    def enpassant_is_legal(self, color, enemy, from_sq):
+        # Replay the capture on the occupancy: it can expose the king along the rank
+        # it clears, and it must also resolve any existing check.
+        bitboards = self.bitboards
+        ep_r, ep_c = self.enpassant_possible
+        captured_bb = SQUARE_BB[(from_sq >> 3) * 8 + ep_c]
+        occupied = ((self.occupancy['w'] | self.occupancy['b']) ^ SQUARE_BB[from_sq] ^ captured_bb) | SQUARE_BB[ep_r * 8 + ep_c]
+        king_sq = bitboards[color + 'K'].bit_length() - 1
+        if KNIGHT_ATTACKS[king_sq] & bitboards[enemy + 'N']:
+            return False
+        if PAWN_ATTACKS[color][king_sq] & bitboards[enemy + 'P'] & ~captured_bb:
+            return False
+        if slider_attacks(king_sq, occupied, ROOK_RAYS) & (bitboards[enemy + 'R'] | bitboards[enemy + 'Q']):
+            return False
+        if slider_attacks(king_sq, occupied, BISHOP_RAYS) & (bitboards[enemy + 'B'] | bitboards[enemy + 'Q']):
+            return False
+        return True
+
     def square_under_attack(self, r, c):
-        self.white_to_move = not self.white_to_move
-        opp_moves = self.get_all_possible_moves()
-        self.white_to_move = not self.white_to_move
-        for move in opp_moves:
-            if move.end_row == r and move.end_col == c:
-                return True
+        return self.is_square_attacked(r * 8 + c, 'b' if self.white_to_move else 'w')
+
+    def is_square_attacked(self, sq, color, occupied=None):
+        # Look outward from the square for each kind of attacker instead of
+        # generating the attacking side's moves.
+        bitboards = self.bitboards
+        if KNIGHT_ATTACKS[sq] & bitboards[color + 'N']:
+            return True
+        if PAWN_ATTACKS['b' if color == 'w' else 'w'][sq] & bitboards[color + 'P']:
+            return True
+        if KING_ATTACKS[sq] & bitboards[color + 'K']:
+            return True
+        if occupied is None:
+            occupied = self.occupancy['w'] | self.occupancy['b']
+        queens = bitboards[color + 'Q']
+        straight = (bitboards[color + 'R'] | queens) & ROOK_LINES[sq]
+        if straight and slider_attacks(sq, occupied, ROOK_RAYS) & straight:
+            return True
+        diagonal = (bitboards[color + 'B'] | queens) & BISHOP_LINES[sq]
+        if diagonal and slider_attacks(sq, occupied, BISHOP_RAYS) & diagonal:
+            return True
         return False
 
+    def attacked_squares(self, color, occupied=None):
+        bitboards = self.bitboards
+        if occupied is None:
+            occupied = self.occupancy['w'] | self.occupancy['b']
+        attacks = 0
+        pawns = bitboards[color + 'P']
+        pawn_attacks = PAWN_ATTACKS[color]
+        while pawns:
+            low = pawns & -pawns
+            attacks |= pawn_attacks[low.bit_length() - 1]
+            pawns ^= low
+        knights = bitboards[color + 'N']
+        while knights:
+            low = knights & -knights
+            attacks |= KNIGHT_ATTACKS[low.bit_length() - 1]
+            knights ^= low
+        diagonal = bitboards[color + 'B'] | bitboards[color + 'Q']
+        while diagonal:
+            low = diagonal & -diagonal
+            attacks |= slider_attacks(low.bit_length() - 1, occupied, BISHOP_RAYS)
+            diagonal ^= low
+        straight = bitboards[color + 'R'] | bitboards[color + 'Q']
+        while straight:
+            low = straight & -straight
+            attacks |= slider_attacks(low.bit_length() - 1, occupied, ROOK_RAYS)
+            straight ^= low
+        kings = bitboards[color + 'K']
+        if kings:
+            attacks |= KING_ATTACKS[kings.bit_length() - 1]
+        return attacks
+
     def get_all_possible_moves(self):
         moves = []
-        for r in range(len(self.board)):
-            for c in range(len(self.board[r])):
-                turn = self.board[r][c][0]
-                if (turn == 'w' and self.white_to_move) or (turn == 'b' and not self.white_to_move):
-                    piece = self.board[r][c][1]
-                    if piece == 'P':
-                        self.get_pawn_moves(r, c, moves)
-                    elif piece == 'R':
-                        self.get_rook_moves(r, c, moves)
-                    elif piece == 'N':
-                        self.get_knight_moves(r, c, moves)
-                    elif piece == 'B':
-                        self.get_bishop_moves(r, c, moves)
-                    elif piece == 'Q':
-                        self.get_queen_moves(r, c, moves)
-                    elif piece == 'K':
-                        self.get_king_moves(r, c, moves)
+        color = 'w' if self.white_to_move else 'b'
+        bitboards = self.bitboards
+        for piece, generate in (('P', self.get_pawn_moves), ('N', self.get_knight_moves),
+                                ('B', self.get_bishop_moves), ('R', self.get_rook_moves),
+                                ('Q', self.get_queen_moves), ('K', self.get_king_moves)):
+            squares = bitboards[color + piece]
+            while squares:
+                low = squares & -squares
+                sq = low.bit_length() - 1
+                generate(sq >> 3, sq & 7, moves)
+                squares ^= low
         return moves
 
+    def add_moves(self, r, c, targets, moves):
+        board = self.board
+        while targets:
+            low = targets & -targets
+            sq = low.bit_length() - 1
+            moves.append(Move((r, c), (sq >> 3, sq & 7), board))
+            targets ^= low
+
+    def add_pawn_moves(self, r, c, targets, moves):
+        if not targets & PROMOTION_RANKS:
+            self.add_moves(r, c, targets, moves)
+            return
+        board = self.board
+        while targets:
+            low = targets & -targets
+            sq = low.bit_length() - 1
+            for choice in PROMOTION_CHOICES:
+                moves.append(Move((r, c), (sq >> 3, sq & 7), board, promotion_choice=choice))
+            targets ^= low
+
     def get_pawn_moves(self, r, c, moves):
+        sq = r * 8 + c
         if self.white_to_move:
-            if self.board[r - 1][c] == "--":
-                moves.append(Move((r, c), (r - 1, c), self.board))
-                if r == 6 and self.board[r - 2][c] == "--":
-                    moves.append(Move((r, c), (r - 2, c), self.board))
-            if c - 1 >= 0:
-                if self.board[r - 1][c - 1][0] == 'b':
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board))
-                elif (r - 1, c - 1) == self.enpassant_possible:
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board, is_enpassant_move=True))
-            if c + 1 <= 7:
-                if self.board[r - 1][c + 1][0] == 'b':
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board))
-                elif (r - 1, c + 1) == self.enpassant_possible:
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board, is_enpassant_move=True))
+            color, enemy, step, start_row = 'w', 'b', -8, 6
         else:
-            if self.board[r + 1][c] == "--":
-                moves.append(Move((r, c), (r + 1, c), self.board))
-                if r == 1 and self.board[r + 2][c] == "--":
-                    moves.append(Move((r, c), (r + 2, c), self.board))
-            if c - 1 >= 0:
-                if self.board[r + 1][c - 1][0] == 'w':
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board))
-                elif (r + 1, c - 1) == self.enpassant_possible:
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board, is_enpassant_move=True))
-            if c + 1 <= 7:
-                if self.board[r + 1][c + 1][0] == 'w':
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board))
-                elif (r + 1, c + 1) == self.enpassant_possible:
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board, is_enpassant_move=True))
+            color, enemy, step, start_row = 'b', 'w', 8, 1
+        empty = ~(self.occupancy['w'] | self.occupancy['b'])
+        attacks = PAWN_ATTACKS[color][sq]
+        targets = attacks & self.occupancy[enemy]
+        one = sq + step
+        if empty & SQUARE_BB[one]:
+            targets |= SQUARE_BB[one]
+            if r == start_row:
+                targets |= empty & SQUARE_BB[one + step]
+        self.add_pawn_moves(r, c, targets, moves)
+        if self.enpassant_possible:
+            ep_r, ep_c = self.enpassant_possible
+            if attacks & SQUARE_BB[ep_r * 8 + ep_c] and self.board[ep_r][ep_c] == '--':
+                moves.append(Move((r, c), (ep_r, ep_c), self.board, is_enpassant_move=True))
 
     def get_rook_moves(self, r, c, moves):
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
-        enemy_color = "b" if self.white_to_move else "w"
-        for d in directions:
-            for i in range(1, 8):
-                end_row = r + d[0] * i
-                end_col = c + d[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece == "--":
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
-                    elif end_piece[0] == enemy_color:
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
-                        break
-                    else:
-                        break
-                else:
-                    break
+        own = self.occupancy['w' if self.white_to_move else 'b']
+        occupied = self.occupancy['w'] | self.occupancy['b']
+        self.add_moves(r, c, slider_attacks(r * 8 + c, occupied, ROOK_RAYS) & ~own, moves)
 
     def get_knight_moves(self, r, c, moves):
-        knight_moves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-        ally_color = "w" if self.white_to_move else "b"
-        for m in knight_moves:
-            end_row = r + m[0]
-            end_col = c + m[1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] != ally_color:
-                    moves.append(Move((r, c), (end_row, end_col), self.board))
+        own = self.occupancy['w' if self.white_to_move else 'b']
+        self.add_moves(r, c, KNIGHT_ATTACKS[r * 8 + c] & ~own, moves)
 
     def get_bishop_moves(self, r, c, moves):
-        directions = ((-1, -1), (-1, 1), (1, -1), (1, 1))
-        enemy_color = "b" if self.white_to_move else "w"
-        for d in directions:
-            for i in range(1, 8):
-                end_row = r + d[0] * i
-                end_col = c + d[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece == "--":
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
-                    elif end_piece[0] == enemy_color:
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
-                        break
-                    else:
-                        break
-                else:
-                    break
+        own = self.occupancy['w' if self.white_to_move else 'b']
+        occupied = self.occupancy['w'] | self.occupancy['b']
+        self.add_moves(r, c, slider_attacks(r * 8 + c, occupied, BISHOP_RAYS) & ~own, moves)
 
     def get_queen_moves(self, r, c, moves):
         self.get_rook_moves(r, c, moves)
         self.get_bishop_moves(r, c, moves)
 
     def get_king_moves(self, r, c, moves):
-        king_moves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
-        ally_color = "w" if self.white_to_move else "b"
-        for i in range(8):
-            end_row = r + king_moves[i][0]
-            end_col = c + king_moves[i][1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] != ally_color:
-                    moves.append(Move((r, c), (end_row, end_col), self.board))
+        own = self.occupancy['w' if self.white_to_move else 'b']
+        self.add_moves(r, c, KING_ATTACKS[r * 8 + c] & ~own, moves)
 
     def get_castle_moves(self, r, c, moves):
         if self.square_under_attack(r, c):
             return
-        if (self.white_to_move and self.current_castling_rights.wks) or (not self.white_to_move and self.current_castling_rights.bks):
+        if self.castling_rights & (WKS if self.white_to_move else BKS):
             self.get_kingside_castle_moves(r, c, moves)
-        if (self.white_to_move and self.current_castling_rights.wqs) or (not self.white_to_move and self.current_castling_rights.bqs):
+        if self.castling_rights & (WQS if self.white_to_move else BQS):
             self.get_queenside_castle_moves(r, c, moves)
 
     def get_kingside_castle_moves(self, r, c, moves):
@@ -1,25 +1,34 @@
 import os
-import pygame
 import asyncio
 import argparse
 import json
-from typing import Optional
+import queue
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+from engine import GameState, Move
+from wire import pack_move, unpack_message
 
 try:
     import websockets
 except Exception:  # pragma: no cover - optional dep for offline mode
     websockets = None
 
-# Initialize Pygame
-pygame.init()
+# Imported by init_display() when the GUI starts, so importing this module or running
+# --headless never loads SDL or opens a window
+pygame = None
 
 DIMENSION = 8
 SQ_SIZE = 80  # Par exemple, ajustez selon vos besoins
 BORDER_SIZE = SQ_SIZE  # Taille de la bordure égale à une case
 WIDTH = HEIGHT = DIMENSION * SQ_SIZE + 2 * BORDER_SIZE
-MAX_FPS = 15
+# Posted by the network thread for each server message; the message dict is in event.msg.
+# Registered by init_display()
+NET_EVENT = None
 
-BORDER_COLOR = pygame.Color("#553A19")
+BORDER_COLOR = "#553A19"
 
 # Unicode chess pieces
 PIECES = {
@@ -27,422 +36,109 @@ PIECES = {
     'k': '♚', 'q': '♛', 'r': '♜', 'b': '♝', 'n': '♞', 'p': '♟'
 }
 
-IMAGES = {}
-
-# Ajoutez ceci près du début de votre fichier, avec vos autres constantes
-PIECE_OFFSETS = {
-    'P': 30,  # Pion
-    'R': 30,   # Tour
-    'N': 30,   # Cavalier
-    'B': 35,   # Fou
-    'Q': 30,   # Reine
-    'K': 40    # Roi
-}
-
-# Initialize the screen
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Chess")
-clock = pygame.time.Clock()
-
-class GameState:
-    def __init__(self):
-        self.board = [
-            ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
-            ["bP", "bP", "bP", "bP", "bP", "bP", "bP", "bP"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["wP", "wP", "wP", "wP", "wP", "wP", "wP", "wP"],
-            ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
-        ]
-        self.white_to_move = True
-        self.in_check = False
-        self.move_log = []
-        self.white_king_location = (7, 4)
-        self.black_king_location = (0, 4)
-        self.checkmate = False
-        self.stalemate = False
-        self.pins = []
-        self.checks = []
-        self.enpassant_possible = ()  # coordinates for the square where en passant capture is possible
-        self.current_castling_rights = CastleRights(True, True, True, True)
-        self.castle_rights_log = [CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                               self.current_castling_rights.wqs, self.current_castling_rights.bqs)]
-
-    def make_move(self, move):
-        self.board[move.start_row][move.start_col] = "--"
-        self.board[move.end_row][move.end_col] = move.piece_moved
-        self.move_log.append(move)
-        self.white_to_move = not self.white_to_move
-        if move.piece_moved == 'wK':
-            self.white_king_location = (move.end_row, move.end_col)
-        elif move.piece_moved == 'bK':
-            self.black_king_location = (move.end_row, move.end_col)
-
-        # Pawn promotion
-        if move.is_pawn_promotion:
-            self.board[move.end_row][move.end_col] = move.piece_moved[0] + 'Q'
-
-        # En passant move
-        if move.is_enpassant_move:
-            self.board[move.start_row][move.end_col] = "--"  # capturing the pawn
-
-        # Update enpassant_possible variable
-        if move.piece_moved[1] == 'P' and abs(move.start_row - move.end_row) == 2:  # only on 2 square pawn advance
-            self.enpassant_possible = ((move.start_row + move.end_row) // 2, move.start_col)
-        else:
-            self.enpassant_possible = ()
-
-        # Castle move
-        if move.is_castle_move:
-            if move.end_col - move.start_col == 2:  # King-side castle
-                self.board[move.end_row][move.end_col - 1] = self.board[move.end_row][move.end_col + 1]  # moves rook
-                self.board[move.end_row][move.end_col + 1] = '--'  # erase old rook
-            else:  # Queen-side castle
-                self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 2]  # moves rook
-                self.board[move.end_row][move.end_col - 2] = '--'  # erase old rook
-
-        # Update castling rights
-        self.update_castle_rights(move)
-        self.in_check = self.check_for_check()
-        self.castle_rights_log.append(CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                                   self.current_castling_rights.wqs, self.current_castling_rights.bqs))
-
-    def check_for_check(self):
-        if self.white_to_move:
-            return self.square_under_attack(self.white_king_location[0], self.white_king_location[1])
-        else:
-            return self.square_under_attack(self.black_king_location[0], self.black_king_location[1])
-        
-    def undo_move(self):
-        if len(self.move_log) != 0:
-            move = self.move_log.pop()
-            self.board[move.start_row][move.start_col] = move.piece_moved
-            self.board[move.end_row][move.end_col] = move.piece_captured
-            self.white_to_move = not self.white_to_move
-            if move.piece_moved == 'wK':
-                self.white_king_location = (move.start_row, move.start_col)
-            elif move.piece_moved == 'bK':
-                self.black_king_location = (move.start_row, move.start_col)
-            # Undo en passant move
-            if move.is_enpassant_move:
-                self.board[move.end_row][move.end_col] = "--"
-                self.board[move.start_row][move.end_col] = move.piece_captured
-                self.enpassant_possible = (move.end_row, move.end_col)
-            # Undo 2 square pawn advance
-            if move.piece_moved[1] == 'P' and abs(move.start_row - move.end_row) == 2:
-                self.enpassant_possible = ()
-            # Undo castling rights
-            self.castle_rights_log.pop()
-            new_rights = self.castle_rights_log[-1]
-            self.current_castling_rights = CastleRights(new_rights.wks, new_rights.bks, new_rights.wqs, new_rights.bqs)
-            # Undo castle move
-            if move.is_castle_move:
-                if move.end_col - move.start_col == 2:  # King-side castle
-                    self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 1]
-                    self.board[move.end_row][move.end_col - 1] = '--'
-                else:  # Queen-side castle
-                    self.board[move.end_row][move.end_col - 2] = self.board[move.end_row][move.end_col + 1]
-                    self.board[move.end_row][move.end_col + 1] = '--'
-            self.checkmate = False
-            self.stalemate = False
-
-    def update_castle_rights(self, move):
-        if move.piece_moved == 'wK':
-            self.current_castling_rights.wks = False
-            self.current_castling_rights.wqs = False
-        elif move.piece_moved == 'bK':
-            self.current_castling_rights.bks = False
-            self.current_castling_rights.bqs = False
-        elif move.piece_moved == 'wR':
-            if move.start_row == 7:
-                if move.start_col == 0:
-                    self.current_castling_rights.wqs = False
-                elif move.start_col == 7:
-                    self.current_castling_rights.wks = False
-        elif move.piece_moved == 'bR':
-            if move.start_row == 0:
-                if move.start_col == 0:
-                    self.current_castling_rights.bqs = False
-                elif move.start_col == 7:
-                    self.current_castling_rights.bks = False
-
-    def get_valid_moves(self):
-        temp_enpassant_possible = self.enpassant_possible
-        temp_castle_rights = CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                        self.current_castling_rights.wqs, self.current_castling_rights.bqs)
-        # 1. Generate all possible moves
-        moves = self.get_all_possible_moves()
-        # 2. For each move, make the move
-        for i in range(len(moves) - 1, -1, -1):
-            self.make_move(moves[i])
-            # 3. Generate all opponent's moves
-            # 4. For each of opponent's moves, see if they attack your king
-            self.white_to_move = not self.white_to_move
-            if self.check_for_check():
-                moves.remove(moves[i])
-            self.white_to_move = not self.white_to_move
-            self.undo_move()
-        if len(moves) == 0:
-            if self.in_check:
-                self.checkmate = True
-            else:
-                self.stalemate = True
-        else:
-            self.checkmate = False
-            self.stalemate = False
-
-        if self.white_to_move:
-            self.get_castle_moves(self.white_king_location[0], self.white_king_location[1], moves)
-        else:
-            self.get_castle_moves(self.black_king_location[0], self.black_king_location[1], moves)
-
-        self.enpassant_possible = temp_enpassant_possible
-        self.current_castling_rights = temp_castle_rights
-        return moves
-
-    def in_check(self):
-        if self.white_to_move:
-            return self.square_under_attack(self.white_king_location[0], self.white_king_location[1])
-        else:
-            return self.square_under_attack(self.black_king_location[0], self.black_king_location[1])
-
-    def square_under_attack(self, r, c):
-        self.white_to_move = not self.white_to_move
-        opp_moves = self.get_all_possible_moves()
-        self.white_to_move = not self.white_to_move
-        for move in opp_moves:
-            if move.end_row == r and move.end_col == c:
-                return True
-        return False
-
-    def get_all_possible_moves(self):
-        moves = []
-        for r in range(len(self.board)):
-            for c in range(len(self.board[r])):
-                turn = self.board[r][c][0]
-                if (turn == 'w' and self.white_to_move) or (turn == 'b' and not self.white_to_move):
-                    piece = self.board[r][c][1]
-                    if piece == 'P':
-                        self.get_pawn_moves(r, c, moves)
-                    elif piece == 'R':
-                        self.get_rook_moves(r, c, moves)
-                    elif piece == 'N':
-                        self.get_knight_moves(r, c, moves)
-                    elif piece == 'B':
-                        self.get_bishop_moves(r, c, moves)
-                    elif piece == 'Q':
-                        self.get_queen_moves(r, c, moves)
-                    elif piece == 'K':
-                        self.get_king_moves(r, c, moves)
-        return moves
-
-    def get_pawn_moves(self, r, c, moves):
-        if self.white_to_move:
-            if self.board[r - 1][c] == "--":
-                moves.append(Move((r, c), (r - 1, c), self.board))
-                if r == 6 and self.board[r - 2][c] == "--":
-                    moves.append(Move((r, c), (r - 2, c), self.board))
-            if c - 1 >= 0:
-                if self.board[r - 1][c - 1][0] == 'b':
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board))
-                elif (r - 1, c - 1) == self.enpassant_possible:
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board, is_enpassant_move=True))
-            if c + 1 <= 7:
-                if self.board[r - 1][c + 1][0] == 'b':
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board))
-                elif (r - 1, c + 1) == self.enpassant_possible:
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board, is_enpassant_move=True))
-        else:
-            if self.board[r + 1][c] == "--":
-                moves.append(Move((r, c), (r + 1, c), self.board))
-                if r == 1 and self.board[r + 2][c] == "--":
-                    moves.append(Move((r, c), (r + 2, c), self.board))
-            if c - 1 >= 0:
-                if self.board[r + 1][c - 1][0] == 'w':
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board))
-                elif (r + 1, c - 1) == self.enpassant_possible:
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board, is_enpassant_move=True))
-            if c + 1 <= 7:
-                if self.board[r + 1][c + 1][0] == 'w':
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board))
-                elif (r + 1, c + 1) == self.enpassant_possible:
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board, is_enpassant_move=True))
-
-    def get_rook_moves(self, r, c, moves):
-            directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
-            enemy_color = "b" if self.white_to_move else "w"
-            for d in directions:
-                for i in range(1, 8):
-                    end_row = r + d[0] * i
-                    end_col = c + d[1] * i
-                    if 0 <= end_row < 8 and 0 <= end_col < 8:
-                        end_piece = self.board[end_row][end_col]
-                        if end_piece == "--":
-                            moves.append(Move((r, c), (end_row, end_col), self.board))
-                        elif end_piece[0] == enemy_color:
-                            moves.append(Move((r, c), (end_row, end_col), self.board))
-                            break
-                        else:
-                            break
-                    else:
-                        break
-
-    def get_knight_moves(self, r, c, moves):
-        knight_moves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-        ally_color = "w" if self.white_to_move else "b"
-        for m in knight_moves:
-            end_row = r + m[0]
-            end_col = c + m[1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] != ally_color:
-                    moves.append(Move((r, c), (end_row, end_col), self.board))
-
-    def get_bishop_moves(self, r, c, moves):
-        directions = ((-1, -1), (-1, 1), (1, -1), (1, 1))
-        enemy_color = "b" if self.white_to_move else "w"
-        for d in directions:
-            for i in range(1, 8):
-                end_row = r + d[0] * i
-                end_col = c + d[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece == "--":
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
-                    elif end_piece[0] == enemy_color:
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
-                        break
-                    else:
-                        break
-                else:
-                    break
-                    
-    def get_queen_moves(self, r, c, moves):
-        self.get_rook_moves(r, c, moves)
-        self.get_bishop_moves(r, c, moves)
-
-    def get_king_moves(self, r, c, moves):
-        king_moves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
-        ally_color = "w" if self.white_to_move else "b"
-        for i in range(8):
-            end_row = r + king_moves[i][0]
-            end_col = c + king_moves[i][1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] != ally_color:
-                    moves.append(Move((r, c), (end_row, end_col), self.board))
-
-    def get_castle_moves(self, r, c, moves):
-        if self.square_under_attack(r, c):
-            return
-        if (self.white_to_move and self.current_castling_rights.wks) or (not self.white_to_move and self.current_castling_rights.bks):
-            self.get_kingside_castle_moves(r, c, moves)
-        if (self.white_to_move and self.current_castling_rights.wqs) or (not self.white_to_move and self.current_castling_rights.bqs):
-            self.get_queenside_castle_moves(r, c, moves)
-
-    def get_kingside_castle_moves(self, r, c, moves):
-        if self.board[r][c+1] == '--' and self.board[r][c+2] == '--':
-            if not self.square_under_attack(r, c+1) and not self.square_under_attack(r, c+2):
-                moves.append(Move((r, c), (r, c+2), self.board, is_castle_move=True))
-
-    def get_queenside_castle_moves(self, r, c, moves):
-        if self.board[r][c-1] == '--' and self.board[r][c-2] == '--' and self.board[r][c-3] == '--':
-            if not self.square_under_attack(r, c-1) and not self.square_under_attack(r, c-2):
-                moves.append(Move((r, c), (r, c-2), self.board, is_castle_move=True))
-
-class CastleRights():
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
-
-class Move():
-    ranks_to_rows = {"1": 7, "2": 6, "3": 5, "4": 4,
-                     "5": 3, "6": 2, "7": 1, "8": 0}
-    rows_to_ranks = {v: k for k, v in ranks_to_rows.items()}
-    files_to_cols = {"a": 0, "b": 1, "c": 2, "d": 3,
-                     "e": 4, "f": 5, "g": 6, "h": 7}
-    cols_to_files = {v: k for k, v in files_to_cols.items()}
-
-    def __init__(self, start_sq, end_sq, board, is_enpassant_move=False, is_castle_move=False):
-        self.start_row = start_sq[0]
-        self.start_col = start_sq[1]
-        self.end_row = end_sq[0]
-        self.end_col = end_sq[1]
-        self.piece_moved = board[self.start_row][self.start_col]
-        self.piece_captured = board[self.end_row][self.end_col]
-        self.is_pawn_promotion = (self.piece_moved == 'wP' and self.end_row == 0) or (self.piece_moved == 'bP' and self.end_row == 7)
-        self.is_enpassant_move = is_enpassant_move
-        if self.is_enpassant_move:
-            self.piece_captured = 'wP' if self.piece_moved == 'bP' else 'bP'
-        self.is_castle_move = is_castle_move
-        self.is_capture = self.piece_captured != '--'
-        self.move_id = self.start_row * 1000 + self.start_col * 100 + self.end_row * 10 + self.end_col
-
-    def __eq__(self, other):
-        if isinstance(other, Move):
-            return self.move_id == other.move_id
-        return False
-
-    def get_chess_notation(self):
-        return self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col)
-
-    def get_rank_file(self, r, c):
-        return self.cols_to_files[c] + self.rows_to_ranks[r]
-
-def draw_game_state(screen, gs, valid_moves, square_selected):
-    draw_border(screen)
-    draw_board(screen)
-    highlight_squares(screen, gs, valid_moves, square_selected)
-    draw_pieces(screen, gs.board)
+def init_display():
+    global pygame, NET_EVENT
+    import pygame
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Chess")
+    NET_EVENT = pygame.event.custom_type()
+    return screen
 
 def draw_board(screen):
     colors = [pygame.Color("#F3EBD7"), pygame.Color("#A27754")]
     for r in range(DIMENSION):
         for c in range(DIMENSION):
             color = colors[((r+c) % 2)]
-            rect = pygame.Rect(
-                c*SQ_SIZE + BORDER_SIZE, 
-                r*SQ_SIZE + BORDER_SIZE,
-                SQ_SIZE, SQ_SIZE
-            )
+            rect = square_rect(r, c)
             pygame.draw.rect(screen, color, rect)
             
             # Dessiner le contour
-            pygame.draw.rect(screen, BORDER_COLOR, rect, 1)  # Le '1' à la fin indique l'épaisseur du contour
-            
-def highlight_squares(screen, gs, valid_moves, square_selected):
-    if square_selected != ():
-        r, c = square_selected
-        if gs.board[r][c][0] == ('w' if gs.white_to_move else 'b'):
-            s = pygame.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(100)
-            s.fill(pygame.Color('blue'))
-            screen.blit(s, (c*SQ_SIZE + BORDER_SIZE, r*SQ_SIZE + BORDER_SIZE))
-            s.fill(pygame.Color('yellow'))
-            for move in valid_moves:
-                if move.start_row == r and move.start_col == c:
-                    screen.blit(s, (move.end_col*SQ_SIZE + BORDER_SIZE, move.end_row*SQ_SIZE + BORDER_SIZE))
-                    
-def draw_pieces(screen, board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            piece = board[r][c]
-            if piece != "--":
-                image = IMAGES[piece]
-                rect = image.get_rect()
-                # Calculer le centre de la case
-                center_x = c * SQ_SIZE + BORDER_SIZE + SQ_SIZE // 2
-                center_y = r * SQ_SIZE + BORDER_SIZE + SQ_SIZE // 2
-                # Utiliser l'offset personnalisé pour chaque type de pièce
-                offset_y = PIECE_OFFSETS[piece[1]]
-                # Positionner l'image avec le décalage
-                rect.center = (center_x, center_y - offset_y)
-                screen.blit(image, rect)
-                
+            pygame.draw.rect(screen, pygame.Color(BORDER_COLOR), rect, 1)  # Le '1' à la fin indique l'épaisseur du contour
+
+def square_rect(r, c):
+    return pygame.Rect(c*SQ_SIZE + BORDER_SIZE, r*SQ_SIZE + BORDER_SIZE, SQ_SIZE, SQ_SIZE)
+
+class BoardRenderer:
+    # Retained-mode drawing: the border and squares are rendered once to a background
+    # surface, and each frame only repaints the squares whose piece or highlight changed.
+    # Piece sprites are taller than a square, so a dirty square also covers the visible
+    # part of the sprites on it, and every sprite overlapping that area is redrawn.
+    def __init__(self, screen, atlas):
+        self.screen = screen
+        self.atlas = atlas
+        self.background = pygame.Surface(screen.get_size()).convert()
+        draw_border(self.background)
+        draw_board(self.background)
+        self.highlight = pygame.Surface((SQ_SIZE, SQ_SIZE))
+        self.highlight.set_alpha(100)
+        self.board = None
+        self.marks = {}
+        self.text = None
+
+    def invalidate(self):
+        # Repaint everything next frame (window exposed, resized...)
+        self.board = None
+
+    def sprite_area(self, r, c, piece):
+        return self.atlas.dest(piece, c*SQ_SIZE + BORDER_SIZE, r*SQ_SIZE + BORDER_SIZE)
+
+    def render(self, gs, valid_moves, square_selected, text=None):
+        marks = {}
+        if square_selected != ():
+            r, c = square_selected
+            if gs.board[r][c][0] == ('w' if gs.white_to_move else 'b'):
+                marks[(r, c)] = 'blue'
+                for move in valid_moves:
+                    if move.start_row == r and move.start_col == c:
+                        marks[(move.end_row, move.end_col)] = 'yellow'
+        if self.board is None or text != self.text:
+            self.board = [row[:] for row in gs.board]
+            self.marks = marks
+            self.text = text
+            self.paint(self.screen.get_rect())
+            pygame.display.flip()
+            return
+        rects = []
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                old, new = self.board[r][c], gs.board[r][c]
+                if old == new and self.marks.get((r, c)) == marks.get((r, c)):
+                    continue
+                rect = square_rect(r, c)
+                for piece in (old, new):
+                    if piece != "--":
+                        rect.union_ip(self.sprite_area(r, c, piece))
+                rects.append(rect)
+        if not rects:
+            return
+        self.board = [row[:] for row in gs.board]
+        self.marks = marks
+        for rect in rects:
+            self.paint(rect)
+        pygame.display.update(rects)
+
+    def paint(self, area):
+        screen = self.screen
+        screen.set_clip(area)
+        screen.blit(self.background, area, area)
+        for (r, c), color in self.marks.items():
+            rect = square_rect(r, c)
+            if rect.colliderect(area):
+                self.highlight.fill(pygame.Color(color))
+                screen.blit(self.highlight, rect)
+        # Same order as a full redraw, so overlapping sprites stack identically
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                piece = self.board[r][c]
+                if piece != "--":
+                    dest = self.sprite_area(r, c, piece)
+                    if dest.colliderect(area):
+                        screen.blit(self.atlas.surface, dest, self.atlas.sources[piece])
+        if self.text is not None:
+            draw_text(screen, self.text)
+        screen.set_clip(None)
+
 def draw_border(screen):
     border_color = pygame.Color("#5D4037")  # Couleur de bordure marron foncé
     pygame.draw.rect(screen, border_color, pygame.Rect(0, 0, WIDTH, HEIGHT))
@@ -451,35 +147,35 @@ def draw_border(screen):
         BORDER_SIZE, BORDER_SIZE, 
         WIDTH - 2*BORDER_SIZE, HEIGHT - 2*BORDER_SIZE))
                 
-def load_images():
-    pieces = ['wP', 'wR', 'wN', 'wB', 'wK', 'wQ', 'bP', 'bR', 'bN', 'bB', 'bK', 'bQ']
-    for piece in pieces:
-        image = pygame.image.load("images/" + piece + ".png")
-        IMAGES[piece] = pygame.transform.scale(image, (int(SQ_SIZE * 2.2), int(SQ_SIZE * 2.2)))
-        
 class OnlineClient:
-    def __init__(self, server_ws_url: str):
+    def __init__(self, server_ws_url: str, on_message: Callable[[dict], None]):
         if websockets is None:
             raise RuntimeError("websockets package not installed. Run: pip install websockets")
         self.server_ws_url = server_ws_url
         self.ws: Optional[websockets.WebSocketClientProtocol] = None
         self.code: Optional[str] = None
         self.color: Optional[str] = None  # 'w' or 'b'
-        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.seq = -1  # last applied server state version
+        self.binary = False  # server agreed to compact binary frames
+        self.token: Optional[str] = None  # lets a dropped connection take its seat back
+        self.stale = False  # a move was lost while disconnected
+        self.on_message = on_message  # called from the network thread
 
     async def connect_and_create(self):
         self.ws = await websockets.connect(self.server_ws_url)
-        await self.ws.send(json.dumps({"action": "create"}))
+        await self.ws.send(json.dumps({"action": "create", "encoding": "binary"}))
         msg = json.loads(await self.ws.recv())
         if msg.get("type") != "created":
             raise RuntimeError(f"Unexpected server response: {msg}")
         self.code = msg["code"]
         self.color = msg["color"]
+        self.binary = msg.get("encoding") == "binary"
+        self.token = msg.get("token")
         asyncio.create_task(self._reader())
 
     async def connect_and_join(self, code: str):
         self.ws = await websockets.connect(self.server_ws_url)
-        await self.ws.send(json.dumps({"action": "join", "code": code}))
+        await self.ws.send(json.dumps({"action": "join", "code": code, "encoding": "binary"}))
         msg = json.loads(await self.ws.recv())
         if msg.get("type") not in {"joined", "error"}:
             raise RuntimeError(f"Unexpected server response: {msg}")
@@ -487,6 +183,21 @@ class OnlineClient:
             raise RuntimeError(msg.get("message", "Failed to join"))
         self.code = msg["code"]
         self.color = msg["color"]
+        self.binary = msg.get("encoding") == "binary"
+        self.token = msg.get("token")
+        asyncio.create_task(self._reader())
+
+    async def connect_and_watch(self, code: str):
+        self.ws = await websockets.connect(self.server_ws_url)
+        await self.ws.send(json.dumps({"action": "watch", "code": code, "encoding": "binary"}))
+        msg = json.loads(await self.ws.recv())
+        if msg.get("type") == "error":
+            raise RuntimeError(msg.get("message", "Failed to watch"))
+        if msg.get("type") != "watching":
+            raise RuntimeError(f"Unexpected server response: {msg}")
+        self.code = msg["code"]
+        self.color = None
+        self.binary = msg.get("encoding") == "binary"
         asyncio.create_task(self._reader())
 
     async def _reader(self):
@@ -494,28 +205,305 @@ class OnlineClient:
             assert self.ws is not None
             while True:
                 raw = await self.ws.recv()
-                try:
-                    msg = json.loads(raw)
-                except Exception:
+                if isinstance(raw, bytes):
+                    msg = unpack_message(raw)
+                    if msg is None:
+                        continue
+                else:
+                    try:
+                        msg = json.loads(raw)
+                    except Exception:
+                        continue
+                if msg.get("type") == "ping":
+                    await self.ws.send(json.dumps({"type": "pong"}))
                     continue
-                await self.incoming.put(msg)
+                self.on_message(msg)
         except Exception:
-            await self.incoming.put({"type": "disconnected"})
+            if not await self.resume():
+                self.on_message({"type": "disconnected"})
+
+    async def resume(self, attempts: int = 6) -> bool:
+        # Reconnect with the session token; the server replays what we missed since seq
+        if self.token is None:
+            return False
+        delay = 1.0
+        for _ in range(attempts):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+            try:
+                self.ws = await websockets.connect(self.server_ws_url)
+                await self.ws.send(json.dumps({"action": "resume", "code": self.code, "token": self.token,
+                                               "seq": self.seq, "encoding": "binary"}))
+                msg = json.loads(await self.ws.recv())
+            except Exception:
+                continue
+            if msg.get("type") != "resumed":
+                # Session expired or room gone
+                self.token = None
+                return False
+            self.binary = msg.get("encoding") == "binary"
+            self.on_message(msg)
+            asyncio.create_task(self._reader())
+            if self.stale:
+                self.stale = False
+                await self.request_resync()
+            return True
+        return False
 
     async def send_move(self, move):
         if self.ws is None:
             return
-        payload = {
-            "type": "move",
-            "move": {
-                "from": [move.start_row, move.start_col],
-                "to": [move.end_row, move.end_col],
-            },
-        }
-        await self.ws.send(json.dumps(payload))
+        promotion = move.promotion_choice if move.is_pawn_promotion else None
+        if self.binary:
+            frame = pack_move((move.start_row, move.start_col), (move.end_row, move.end_col), promotion)
+        else:
+            frame = json.dumps({
+                "type": "move",
+                "move": {
+                    "from": [move.start_row, move.start_col],
+                    "to": [move.end_row, move.end_col],
+                    "promotion": promotion,
+                },
+            })
+        try:
+            await self.ws.send(frame)
+        except Exception:
+            # Connection dropped; take the server's position once resumed
+            self.stale = True
+
+    async def request_resync(self):
+        await self.send_command("resync")
 
+    async def send_command(self, kind: str):
+        # resync, undo or reset; the server answers with a snapshot or delta
+        if self.ws is None:
+            return
+        try:
+            await self.ws.send(json.dumps({"type": kind}))
+        except Exception:
+            self.stale = True
 
-async def main():
+    async def close(self):
+        self.token = None  # leaving on purpose: do not resume
+        if self.ws is not None:
+            await self.ws.close()
+
+
+class NetworkThread:
+    # Runs the websocket client on its own asyncio loop, so the UI thread can block in
+    # pygame.event.wait() and still wake up as soon as a server message is posted
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self, coro):
+        # Wait for the result, e.g. the create/join handshake
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def submit(self, coro):
+        asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=1)
+
+
+def post_message(msg):
+    pygame.event.post(pygame.event.Event(NET_EVENT, msg=msg))
+
+
+def delta_applied(gs, changes):
+    return all(gs.board[r][c] == piece for r, c, piece in changes)
+
+
+# Server messages that change the position, or may have left ours out of step
+GAME_MESSAGES = {"state", "delta", "opponent_undo", "opponent_reset", "error"}
+
+
+def apply_server_message(gs, online, net, msg):
+    # Brings the local game in line with a position update from the server; returns the
+    # game to continue with, a new object when it had to be rebuilt
+    t = msg.get("type")
+    if t == "state":
+        # Full snapshot (join, reset or resync); keep our game if it already matches
+        online.seq = msg.get("seq", -1)
+        if gs.board != msg.get("board") or gs.white_to_move != msg.get("white_to_move"):
+            # JSON and binary snapshots both carry the exact FEN
+            gs = GameState.from_fen(msg["fen"])
+    elif t == "delta":
+        if msg.get("seq", 0) <= online.seq:
+            return gs  # already covered by the last snapshot
+        if msg.get("seq") != online.seq + 1:
+            # Missed an update; wait for the snapshot instead
+            net.submit(online.request_resync())
+            return gs
+        online.seq = msg["seq"]
+        changes = msg.get("changes", [])
+        if not delta_applied(gs, changes):
+            # Not our own move echoed back: replay it through the rules
+            if msg.get("undo"):
+                gs.undo_move()
+            else:
+                m = msg.get("move", {})
+                frm = m.get("from", [0, 0])
+                to = m.get("to", [0, 0])
+                opp_move = Move((frm[0], frm[1]), (to[0], to[1]), gs.board)
+                # Apply only if legal
+                valids = gs.get_valid_moves()
+                promotion = m.get("promotion") or 'Q'
+                for mv in valids:
+                    if mv == opp_move and (not mv.is_pawn_promotion or mv.promotion_choice == promotion):
+                        gs.make_move(mv)
+                        break
+            if not delta_applied(gs, changes) or gs.white_to_move != msg.get("white_to_move"):
+                net.submit(online.request_resync())
+    elif t == "opponent_undo":
+        gs.undo_move()
+    elif t == "opponent_reset":
+        gs = GameState()
+    elif t == "error":
+        # A move we already played locally may have been refused (e.g. "Server busy, move
+        # not played"): take the server's position again
+        print(f"Server error: {msg.get('message')}")
+        net.submit(online.request_resync())
+    return gs
+
+
+def report_server_message(msg):
+    t = msg.get("type")
+    if t == "opponent_left":
+        print("Opponent disconnected.")
+    elif t == "opponent_resumed":
+        print("Opponent reconnected.")
+    elif t == "resumed":
+        print("Reconnected.")
+    elif t == "room_closed":
+        print("Both players left; the game is over.")
+    elif t == "disconnected":
+        print("Connection lost.")
+
+
+def connect_online(args, on_message):
+    # Hosts, joins or watches as asked on the command line; returns (net, client, color)
+    if websockets is None:
+        raise SystemExit("Online mode requires 'websockets' package. pip install websockets")
+    net = NetworkThread()
+    online = OnlineClient(args.server, on_message)
+    my_color = None
+    if args.watch_code:
+        net.run(online.connect_and_watch(args.watch_code))
+        print(f"Watching game {online.code}")
+    elif args.join_code:
+        net.run(online.connect_and_join(args.join_code))
+        my_color = online.color
+        print(f"Joined game {online.code} as {'White' if my_color=='w' else 'Black'}")
+    else:
+        net.run(online.connect_and_create())
+        my_color = online.color
+        print(f"Hosting game. Share code: {online.code}. You are {'White' if my_color=='w' else 'Black'}")
+        print("Tip: your friend can join with:")
+        print(f"  python main.py --online --server {args.server} --join {online.code}")
+    return net, online, my_color
+
+
+def game_result(gs):
+    if gs.checkmate:
+        return "Black wins by checkmate" if gs.white_to_move else "White wins by checkmate"
+    if gs.stalemate:
+        return "Stalemate"
+    return None
+
+
+def parse_moves(text):
+    # Coordinate notation as written by Move.get_chess_notation, e.g. "e2e4 e7e8q"; move
+    # numbers like "1." are skipped
+    return [token.lower() for token in text.split() if not token.rstrip('.').isdigit()]
+
+
+def find_move(gs, notation):
+    for move in gs.get_valid_moves():
+        if move.get_chess_notation() in (notation, notation + 'q'):
+            return move
+    return None
+
+
+def play_headless(args):
+    # Games without a display, for CI and soak tests: replay a move list, or let random
+    # legal moves play each other; prints one line per game and the overall throughput
+    rng = random.Random(args.seed)
+    total_moves = 0
+    start = time.perf_counter()
+    for game in range(1, args.games + 1):
+        gs = GameState.from_fen(args.fen) if args.fen else GameState()
+        if args.replay:
+            with open(args.replay) as f:
+                moves = parse_moves(f.read())
+            for notation in moves:
+                move = find_move(gs, notation)
+                if move is None:
+                    raise SystemExit(f"Illegal move {notation!r} after {len(gs.move_log)} moves: {gs.to_fen()}")
+                gs.make_move(move)
+            gs.get_valid_moves()  # sets checkmate/stalemate
+        else:
+            while len(gs.move_log) < args.max_moves:
+                valid_moves = gs.get_valid_moves()
+                if not valid_moves:
+                    break
+                gs.make_move(rng.choice(valid_moves))
+            gs.get_valid_moves()
+        total_moves += len(gs.move_log)
+        print(f"game {game}: {game_result(gs) or 'unfinished'} after {len(gs.move_log)} moves, {gs.to_fen()}")
+    elapsed = time.perf_counter() - start
+    print(f"{args.games} games, {total_moves} moves in {elapsed:.2f}s ({total_moves / max(elapsed, 1e-9):.0f} moves/s)")
+
+
+def play_headless_online(args):
+    # A display-less online player: answers with random legal moves on its turn, or just
+    # follows the game when watching. Stops at the end of the game or when the room closes.
+    rng = random.Random(args.seed)
+    inbox = queue.Queue()
+    net, online, my_color = connect_online(args, inbox.put)
+    gs = GameState()
+    awaiting_echo = False
+    try:
+        while True:
+            try:
+                msg = inbox.get(timeout=args.idle_timeout)
+            except queue.Empty:
+                print("No message from the server; giving up.")
+                return
+            t = msg.get("type")
+            if t in GAME_MESSAGES:
+                gs = apply_server_message(gs, online, net, msg)
+                awaiting_echo = False
+            else:
+                report_server_message(msg)
+                if t == "room_closed" or (t == "disconnected" and online.token is None):
+                    return
+            valid_moves = gs.get_valid_moves()
+            result = game_result(gs)
+            # seq counts every move of the game, including those before we joined
+            if result or online.seq >= args.max_moves:
+                print(f"{result or 'unfinished'} after {online.seq} moves, {gs.to_fen()}")
+                return
+            my_turn = my_color is not None and (my_color == 'w') == gs.white_to_move
+            # Move only once the server confirmed the last one and nothing newer is queued
+            if my_turn and not awaiting_echo and inbox.empty():
+                time.sleep(args.move_delay)
+                move = rng.choice(valid_moves)
+                gs.make_move(move)
+                net.submit(online.send_move(move))
+                awaiting_echo = True
+    finally:
+        try:
+            net.run(online.close())
+        except Exception:
+            pass
+        net.stop()
+
+
+def main():
     parser = argparse.ArgumentParser(description="PyChess - local or online play")
     parser.add_argument("--online", action="store_true", help="Enable online multiplayer mode")
     parser.add_argument(
@@ -524,15 +512,33 @@ async def main():
         help="WebSocket server URL (override with env WS_SERVER_URL)",
     )
     parser.add_argument("--join", dest="join_code", default=None, help="Join an existing game code instead of hosting")
+    parser.add_argument("--watch", dest="watch_code", default=None, help="Watch an existing game as a spectator")
+    parser.add_argument("--headless", action="store_true",
+                        help="No display: self-play or --replay offline, or a random-move bot with --online")
+    parser.add_argument("--replay", default=None, help="Headless: play the moves in this file (e.g. e2e4 e7e5 ...)")
+    parser.add_argument("--fen", default=None, help="Headless: start position")
+    parser.add_argument("--games", type=int, default=1, help="Headless: number of games to play")
+    parser.add_argument("--max-moves", type=int, default=300, help="Headless: stop a game after this many moves")
+    parser.add_argument("--seed", type=int, default=None, help="Headless: random seed for self-play")
+    parser.add_argument("--move-delay", type=float, default=0.0, help="Headless online: seconds to wait before moving")
+    parser.add_argument("--idle-timeout", type=float, default=300.0,
+                        help="Headless online: give up after this long without a server message")
     args = parser.parse_args()
-    pygame.init()
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))  # Mettez cette ligne ici
-    clock = pygame.time.Clock()
-    screen.fill(pygame.Color("white"))
+    if args.headless:
+        if args.online:
+            play_headless_online(args)
+        else:
+            play_headless(args)
+        return
+
+    screen = init_display()
+    from assets import load_atlas
+    # Mouse motion is not used; blocking it keeps the loop asleep while the pointer moves
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
     gs = GameState()
     valid_moves = gs.get_valid_moves()
     move_made = False
-    load_images()
+    renderer = BoardRenderer(screen, load_atlas(SQ_SIZE))
     running = True
     square_selected = ()
     player_clicks = []
@@ -540,28 +546,21 @@ async def main():
 
     # Online mode setup
     online: Optional[OnlineClient] = None
+    net: Optional[NetworkThread] = None
     my_color: Optional[str] = None
     if args.online:
-        if websockets is None:
-            raise SystemExit("Online mode requires 'websockets' package. pip install websockets")
-        online = OnlineClient(args.server)
-        if args.join_code:
-            await online.connect_and_join(args.join_code)
-            my_color = online.color
-            print(f"Joined game {online.code} as {'White' if my_color=='w' else 'Black'}")
-        else:
-            await online.connect_and_create()
-            my_color = online.color
-            print(f"Hosting game. Share code: {online.code}. You are {'White' if my_color=='w' else 'Black'}")
-            print("Tip: your friend can join with:")
-            print(f"  python main.py --online --server {args.server} --join {online.code}")
+        net, online, my_color = connect_online(args, post_message)
 
     while running:
-        for e in pygame.event.get():
+        # Sleep until there is input or a server message, then handle everything pending
+        # and draw once
+        for e in [pygame.event.wait()] + pygame.event.get():
             if e.type == pygame.QUIT:
                 running = False
+            elif e.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                renderer.invalidate()
             elif e.type == pygame.MOUSEBUTTONDOWN:
-                if not game_over:
+                if not game_over and not (args.online and my_color is None):
                     location = pygame.mouse.get_pos()
                     col = (location[0] - BORDER_SIZE) // SQ_SIZE
                     row = (location[1] - BORDER_SIZE) // SQ_SIZE
@@ -592,85 +591,59 @@ async def main():
                                     move_made = True
                                     # Send move if online
                                     if args.online and online is not None:
-                                        try:
-                                            await online.send_move(valid_moves[i])
-                                        except Exception:
-                                            pass
+                                        net.submit(online.send_move(valid_moves[i]))
                                     square_selected = ()
                                     player_clicks = []
+                                    # Promotions come once per piece; the first one is the queen
+                                    break
                             if not move_made:
                                 player_clicks = [square_selected]
-                elif e.type == pygame.KEYDOWN:
-                    if e.key == pygame.K_z:
-                        gs.undo_move()
-                        move_made = True
-                        game_over = False
-                    if e.key == pygame.K_r:
-                        gs = GameState()
-                        valid_moves = gs.get_valid_moves()
+            elif e.type == pygame.KEYDOWN:
+                if args.online:
+                    # The room's game is the server's: ask for it and wait for the update
+                    if online is not None and my_color is not None and e.key in (pygame.K_z, pygame.K_r):
+                        net.submit(online.send_command("undo" if e.key == pygame.K_z else "reset"))
+                    continue
+                if e.key == pygame.K_z:
+                    gs.undo_move()
+                    move_made = True
+                    game_over = False
+                if e.key == pygame.K_r:
+                    gs = GameState()
+                    valid_moves = gs.get_valid_moves()
+                    square_selected = ()
+                    player_clicks = []
+                    move_made = False
+                    game_over = False
+            elif e.type == NET_EVENT:
+                msg = e.msg
+                if msg.get("type") in GAME_MESSAGES:
+                    new_gs = apply_server_message(gs, online, net, msg)
+                    if new_gs is not gs:
                         square_selected = ()
                         player_clicks = []
-                        move_made = False
-                        game_over = False
-
-            if move_made:
-                valid_moves = gs.get_valid_moves()
-                move_made = False
-
-            # Handle online incoming messages
-            if args.online and online is not None:
-                try:
-                    # Non-blocking check for incoming messages
-                    while True:
-                        msg = online.incoming.get_nowait()
-                        t = msg.get("type")
-                        if t == "start":
-                            pass  # Both players connected
-                        elif t == "opponent_move":
-                            m = msg.get("move", {})
-                            frm = m.get("from", [0, 0])
-                            to = m.get("to", [0, 0])
-                            opp_move = Move((frm[0], frm[1]), (to[0], to[1]), gs.board)
-                            # Apply only if legal
-                            valids = gs.get_valid_moves()
-                            for mv in valids:
-                                if mv == opp_move:
-                                    gs.make_move(mv)
-                                    break
-                            valid_moves = gs.get_valid_moves()
-                        elif t == "opponent_undo":
-                            gs.undo_move()
-                            valid_moves = gs.get_valid_moves()
-                        elif t == "opponent_reset":
-                            gs = GameState()
-                            valid_moves = gs.get_valid_moves()
-                            square_selected = ()
-                            player_clicks = []
-                        elif t == "opponent_left":
-                            print("Opponent disconnected.")
-                        elif t == "disconnected":
-                            print("Connection lost.")
-                    
-                except asyncio.QueueEmpty:
-                    pass
-
-            draw_game_state(screen, gs, valid_moves, square_selected)
-
-            if gs.checkmate:
-                game_over = True
-                if gs.white_to_move:
-                    draw_text(screen, "Black wins by checkmate")
+                    gs = new_gs
+                    valid_moves = gs.get_valid_moves()
+                    game_over = False  # set again below if the game is still over
                 else:
-                    draw_text(screen, "White wins by checkmate")
-            elif gs.stalemate:
-                game_over = True
-                draw_text(screen, "Stalemate")
+                    report_server_message(msg)
+
+        if move_made:
+            valid_moves = gs.get_valid_moves()
+            move_made = False
+
+        text = game_result(gs)
+        if text:
+            game_over = True
+        renderer.render(gs, valid_moves, square_selected, text)
+
+    if net is not None:
+        try:
+            net.run(online.close())
+        except Exception:
+            pass
+        net.stop()
 
-            clock.tick(MAX_FPS)
-            pygame.display.flip()
-            await asyncio.sleep(0)
-            
-    
 def draw_text(screen, text):
     font = pygame.font.SysFont("Helvitca", 32, True, False)
     text_object = font.render(text, 0, pygame.Color('Gray'))
@@ -680,4 +653,4 @@ def draw_text(screen, text):
     screen.blit(text_object, text_location.move(2, 2))
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import sys
+import time
+
+from engine import STARTING_FEN, GameState
+
+# Reference node counts per depth, from the published perft tables
+# (chessprogramming.org "Perft Results" and the classic edge-case suite).
+REFERENCE_POSITIONS = [
+    ("startpos", STARTING_FEN,
+     (20, 400, 8902, 197281, 4865609)),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     (48, 2039, 97862, 4085603)),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     (14, 191, 2812, 43238, 674624)),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     (6, 264, 9467, 422333)),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     (44, 1486, 62379, 2103487)),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     (46, 2079, 89890, 3894594)),
+    ("illegal ep 1", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+     (18, 92, 1670, 10138, 185429, 1134888)),
+    ("illegal ep 2", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+     (13, 102, 1266, 10276, 135655, 1015133)),
+    ("ep capture checks", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+     (15, 126, 1928, 13931, 206379, 1440467)),
+    ("castle gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+     (15, 66, 1198, 6399, 120330, 661072)),
+    ("promote out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1",
+     (11, 133, 1442, 19174, 266199, 3821001)),
+    ("underpromote to check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+     (6, 27, 273, 1329, 18135, 92683)),
+    ("self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+     (2, 6, 13, 63, 382, 2217)),
+]
+
+
+def perft(gs, depth):
+    moves = gs.get_valid_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        gs.make_move(move)
+        nodes += perft(gs, depth - 1)
+        gs.undo_move()
+    return nodes
+
+
+def divide(gs, depth):
+    results = {}
+    for move in gs.get_valid_moves():
+        gs.make_move(move)
+        results[move.get_chess_notation()] = perft(gs, depth - 1)
+        gs.undo_move()
+    return results
+
+
+def run_suite(max_depth):
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, expected in REFERENCE_POSITIONS:
+        depth = min(max_depth, len(expected))
+        gs = GameState.from_fen(fen)
+        start = time.perf_counter()
+        nodes = perft(gs, depth)
+        elapsed = time.perf_counter() - start
+        total_nodes += nodes
+        total_time += elapsed
+        ok = nodes == expected[depth - 1]
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name:<22} depth {depth}  {nodes:>10} nodes"
+              f"  (expected {expected[depth - 1]})  {elapsed:7.2f}s")
+    print(f"{total_nodes} nodes in {total_time:.2f}s, {total_nodes / max(total_time, 1e-9):.0f} nodes/s")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PyChess move generator perft and benchmark")
+    parser.add_argument("--fen", default=STARTING_FEN, help="Position to count from (default: start position)")
+    parser.add_argument("--depth", type=int, default=4, help="Search depth in plies")
+    parser.add_argument("--divide", action="store_true", help="Print the node count below each root move")
+    parser.add_argument("--suite", action="store_true",
+                        help="Check the reference positions up to --depth and report overall nodes/s")
+    args = parser.parse_args()
+
+    if args.suite:
+        sys.exit(1 if run_suite(args.depth) else 0)
+
+    gs = GameState.from_fen(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        results = divide(gs, args.depth)
+        for notation, count in sorted(results.items()):
+            print(f"{notation}: {count}")
+        nodes = sum(results.values())
+    else:
+        nodes = perft(gs, args.depth)
+    elapsed = time.perf_counter() - start
+    print(f"Nodes: {nodes}")
+    print(f"Time: {elapsed:.3f}s ({nodes / max(elapsed, 1e-9):.0f} nodes/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from engine import STARTING_FEN, GameState, Move
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+PIECE_VALUES = {'P': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+MATE_SCORE = 100000
+INFINITY = 1000000
+
+# Piece-square tables from White's point of view, row 0 being rank 8 like GameState.board.
+PIECE_SQUARE_TABLES = {
+    'P': (0, 0, 0, 0, 0, 0, 0, 0,
+          50, 50, 50, 50, 50, 50, 50, 50,
+          10, 10, 20, 30, 30, 20, 10, 10,
+          5, 5, 10, 25, 25, 10, 5, 5,
+          0, 0, 0, 20, 20, 0, 0, 0,
+          5, -5, -10, 0, 0, -10, -5, 5,
+          5, 10, 10, -20, -20, 10, 10, 5,
+          0, 0, 0, 0, 0, 0, 0, 0),
+    'N': (-50, -40, -30, -30, -30, -30, -40, -50,
+          -40, -20, 0, 0, 0, 0, -20, -40,
+          -30, 0, 10, 15, 15, 10, 0, -30,
+          -30, 5, 15, 20, 20, 15, 5, -30,
+          -30, 0, 15, 20, 20, 15, 0, -30,
+          -30, 5, 10, 15, 15, 10, 5, -30,
+          -40, -20, 0, 5, 5, 0, -20, -40,
+          -50, -40, -30, -30, -30, -30, -40, -50),
+    'B': (-20, -10, -10, -10, -10, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 10, 10, 5, 0, -10,
+          -10, 5, 5, 10, 10, 5, 5, -10,
+          -10, 0, 10, 10, 10, 10, 0, -10,
+          -10, 10, 10, 10, 10, 10, 10, -10,
+          -10, 5, 0, 0, 0, 0, 5, -10,
+          -20, -10, -10, -10, -10, -10, -10, -20),
+    'R': (0, 0, 0, 0, 0, 0, 0, 0,
+          5, 10, 10, 10, 10, 10, 10, 5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          0, 0, 0, 5, 5, 0, 0, 0),
+    'Q': (-20, -10, -10, -5, -5, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 5, 5, 5, 0, -10,
+          -5, 0, 5, 5, 5, 5, 0, -5,
+          0, 0, 5, 5, 5, 5, 0, -5,
+          -10, 5, 5, 5, 5, 5, 0, -10,
+          -10, 0, 5, 0, 0, 0, 0, -10,
+          -20, -10, -10, -5, -5, -10, -10, -20),
+    'K': (-30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -20, -30, -30, -40, -40, -30, -30, -20,
+          -10, -20, -20, -20, -20, -20, -20, -10,
+          20, 20, 0, 0, 0, 0, 20, 20,
+          20, 30, 10, 0, 0, 10, 30, 20),
+}
+
+# Material plus placement per square, indexed by piece code then bitboard square;
+# Black's tables are White's mirrored top to bottom.
+SQUARE_SCORES = {}
+for _piece, _table in PIECE_SQUARE_TABLES.items():
+    SQUARE_SCORES['w' + _piece] = tuple(PIECE_VALUES[_piece] + _table[sq] for sq in range(64))
+    SQUARE_SCORES['b' + _piece] = tuple(PIECE_VALUES[_piece] + _table[sq ^ 56] for sq in range(64))
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+@dataclass
+class SearchResult:
+    move: Optional[Move]
+    score: int
+    depth: int
+    nodes: int
+    elapsed_ms: float
+
+
+def evaluate(gs):
+    score = 0
+    for piece, bb in gs.bitboards.items():
+        scores = SQUARE_SCORES[piece]
+        total = 0
+        while bb:
+            low = bb & -bb
+            total += scores[low.bit_length() - 1]
+            bb ^= low
+        score += total if piece[0] == 'w' else -total
+    return score if gs.white_to_move else -score
+
+
+def mvv_lva(move):
+    return 10 * PIECE_VALUES[move.piece_captured[1]] - PIECE_VALUES[move.piece_moved[1]]
+
+
+class Searcher:
+    def __init__(self, gs, time_limit_ms=1000, max_depth=64, tt=None):
+        # Search a private copy so the caller's flags and move log are left alone;
+        # the keys of the positions already played are kept for repetition checks.
+        self.gs = GameState.from_fen(gs.to_fen())
+        self.game_keys = [entry[4] for entry in gs.history]
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.time_limit_ms = time_limit_ms
+        self.max_depth = max_depth
+        self.deadline = 0.0
+        self.nodes = 0
+
+    def search(self):
+        start = time.perf_counter()
+        deadline = start + self.time_limit_ms / 1000
+        # Depth 1 always runs to the end, so there is a real move and score to report
+        self.deadline = float("inf")
+        self.nodes = 0
+        self.tt.new_search()
+        root_moves = self.gs.get_valid_moves()
+        if not root_moves:
+            score = -MATE_SCORE if self.gs.in_check else 0
+            return SearchResult(None, score, 0, 0, 0.0)
+        root_moves.sort(key=lambda m: mvv_lva(m) if m.is_capture else -INFINITY, reverse=True)
+        best = SearchResult(root_moves[0], 0, 0, 0, 0.0)
+        for depth in range(1, self.max_depth + 1):
+            try:
+                move, score = self.search_root(root_moves, depth)
+            except SearchTimeout:
+                break
+            best = SearchResult(move, score, depth, self.nodes, (time.perf_counter() - start) * 1000)
+            root_moves.remove(move)
+            root_moves.insert(0, move)
+            self.tt.store(self.gs.zobrist_key, depth, score, EXACT, move.to_code())
+            if abs(score) >= MATE_SCORE - self.max_depth:
+                break
+            self.deadline = deadline
+        best.nodes = self.nodes
+        best.elapsed_ms = (time.perf_counter() - start) * 1000
+        return best
+
+    def search_root(self, moves, depth):
+        gs = self.gs
+        alpha, beta = -INFINITY, INFINITY
+        best_move = moves[0]
+        self.game_keys.append(gs.zobrist_key)
+        try:
+            for move in moves:
+                gs.make_move(move)
+                try:
+                    score = -self.negamax(depth - 1, -beta, -alpha, 1)
+                finally:
+                    gs.undo_move()
+                if score > alpha:
+                    alpha = score
+                    best_move = move
+        finally:
+            self.game_keys.pop()
+        return best_move, alpha
+
+    def negamax(self, depth, alpha, beta, ply):
+        gs = self.gs
+        self.nodes += 1
+        if self.nodes & 255 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+        if gs.halfmove_clock >= 100 or gs.zobrist_key in self.game_keys:
+            return 0
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply)
+        key = gs.zobrist_key
+        tt_move = 0
+        entry = self.tt.probe(key, ply)
+        if entry is not None:
+            tt_depth, tt_score, tt_bound, tt_move = entry
+            if tt_depth >= depth:
+                if (tt_bound == EXACT or (tt_bound == LOWER and tt_score >= beta)
+                        or (tt_bound == UPPER and tt_score <= alpha)):
+                    return tt_score
+        moves = gs.get_valid_moves()
+        if not moves:
+            return -MATE_SCORE + ply if gs.in_check else 0
+        self.order_moves(moves, tt_move)
+        original_alpha = alpha
+        best_code = 0
+        self.game_keys.append(key)
+        try:
+            for move in moves:
+                gs.make_move(move)
+                try:
+                    score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+                finally:
+                    gs.undo_move()
+                if score >= beta:
+                    self.tt.store(key, depth, beta, LOWER, move.to_code(), ply)
+                    return beta
+                if score > alpha:
+                    alpha = score
+                    best_code = move.to_code()
+        finally:
+            self.game_keys.pop()
+        self.tt.store(key, depth, alpha, EXACT if alpha > original_alpha else UPPER, best_code, ply)
+        return alpha
+
+    def quiescence(self, alpha, beta, ply):
+        gs = self.gs
+        self.nodes += 1
+        if self.nodes & 255 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+        moves = gs.get_valid_moves()
+        if not moves:
+            return -MATE_SCORE + ply if gs.in_check else 0
+        if not gs.in_check:
+            stand_pat = evaluate(gs)
+            if stand_pat >= beta:
+                return beta
+            if stand_pat > alpha:
+                alpha = stand_pat
+            moves = [m for m in moves if m.is_capture or (m.is_pawn_promotion and m.promotion_choice == 'Q')]
+        self.order_moves(moves)
+        for move in moves:
+            gs.make_move(move)
+            try:
+                score = -self.quiescence(-beta, -alpha, ply + 1)
+            finally:
+                gs.undo_move()
+            if score >= beta:
+                return beta
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def order_moves(self, moves, tt_move=0):
+        moves.sort(key=lambda m: mvv_lva(m) if m.is_capture else (800 if m.is_pawn_promotion else -INFINITY),
+                   reverse=True)
+        if tt_move:
+            for i, move in enumerate(moves):
+                if move.to_code() == tt_move:
+                    moves.insert(0, moves.pop(i))
+                    break
+
+
+def find_best_move(gs, time_limit_ms=1000, max_depth=64, tt=None):
+    return Searcher(gs, time_limit_ms, max_depth, tt).search()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PyChess engine: best move for a position")
+    parser.add_argument("--fen", default=STARTING_FEN, help="Position to search (default: start position)")
+    parser.add_argument("--ms", type=int, default=1000, help="Time budget in milliseconds")
+    parser.add_argument("--depth", type=int, default=64, help="Maximum search depth in plies")
+    parser.add_argument("--hash", type=float, default=8, help="Transposition table size in megabytes")
+    args = parser.parse_args()
+
+    tt = TranspositionTable(args.hash)
+    result = find_best_move(GameState.from_fen(args.fen), args.ms, args.depth, tt)
+    notation = result.move.get_chess_notation() if result.move else "(none)"
+    print(f"Best move: {notation}  score {result.score}  depth {result.depth}"
+          f"  nodes {result.nodes}  {result.elapsed_ms:.0f}ms")
+    print(f"Hash: {tt.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Deque, Dict, Optional
+
+from engine import GameState
+from perft import perft
+from search import find_best_move
+from transposition import TranspositionTable
+
+MAX_SEARCH_MS = 5000
+MAX_PERFT_DEPTH = 5
+WORKER_HASH_MB = 16
+
+logger = logging.getLogger(__name__)
+_worker_tt: Optional[TranspositionTable] = None
+
+
+# Job functions run inside the worker processes; positions travel as FEN strings.
+def validate_job(fen: str):
+    return GameState.from_fen(fen).get_valid_moves()
+
+
+def search_job(fen: str, time_limit_ms: int):
+    global _worker_tt
+    if _worker_tt is None:
+        _worker_tt = TranspositionTable(WORKER_HASH_MB)
+    return find_best_move(GameState.from_fen(fen), min(time_limit_ms, MAX_SEARCH_MS), tt=_worker_tt)
+
+
+def perft_job(fen: str, depth: int):
+    return perft(GameState.from_fen(fen), min(depth, MAX_PERFT_DEPTH))
+
+
+JOB_FUNCTIONS: Dict[str, Callable] = {
+    "validate": validate_job,
+    "search": search_job,
+    "perft": perft_job,
+}
+
+
+class AnalysisBusy(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    kind: str
+    args: tuple
+    room: str
+    owner: Any
+    future: asyncio.Future
+    queued_at: float
+
+
+# Runs CPU-heavy chess work on a process pool, off the event loop. Jobs wait in one
+# queue per room and are dispatched round-robin across rooms, so a busy room cannot
+# starve the others. The number of waiting jobs is bounded: beyond it submit()
+# raises AnalysisBusy. A worker that dies fails the jobs it broke and the pool is
+# replaced, so later jobs still run.
+class AnalysisService:
+    def __init__(self, workers: Optional[int] = None, max_pending: int = 256):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.queues: "OrderedDict[str, Deque[Job]]" = OrderedDict()
+        self.pending = 0
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.pool_restarts = 0
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self.executor = self._new_pool()
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # Spawned rather than forked: a forked worker inherits uvicorn's signal handlers,
+        # ignores SIGTERM and outlives the server
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def stop(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for queue in self.queues.values():
+            for job in queue:
+                job.future.cancel()
+        self.queues.clear()
+        self.pending = 0
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def submit(self, room: str, owner: Any, kind: str, *args) -> asyncio.Future:
+        if kind not in JOB_FUNCTIONS:
+            raise ValueError(f"Unknown analysis job: {kind}")
+        if self._wakeup is None:
+            raise RuntimeError("AnalysisService is not started")
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise AnalysisBusy("Analysis queue is full")
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(room, deque()).append(Job(kind, args, room, owner, future, time.monotonic()))
+        self.pending += 1
+        self.submitted += 1
+        self._wakeup.set()
+        return future
+
+    async def run(self, room: str, owner: Any, kind: str, *args):
+        return await self.submit(room, owner, kind, *args)
+
+    def cancel(self, owner: Any) -> int:
+        # Drop everything a disconnected socket still has waiting; results of jobs
+        # already running are discarded when they come back.
+        dropped = 0
+        for room in list(self.queues):
+            queue = self.queues[room]
+            kept = deque()
+            for job in queue:
+                if job.owner is owner:
+                    job.future.cancel()
+                    dropped += 1
+                else:
+                    kept.append(job)
+            if kept:
+                self.queues[room] = kept
+            else:
+                del self.queues[room]
+        self.pending -= dropped
+        self.cancelled += dropped
+        return dropped
+
+    def metrics(self) -> Dict[str, Any]:
+        started = self.completed + self.failed + self.in_flight
+        return {
+            "workers": self.workers,
+            "queued": self.pending,
+            "in_flight": self.in_flight,
+            "rooms_waiting": len(self.queues),
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "pool_restarts": self.pool_restarts,
+            "avg_wait_ms": round(1000 * self.total_wait / started, 2) if started else 0.0,
+        }
+
+    async def _dispatch(self) -> None:
+        assert self._wakeup is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            while self.in_flight < self.workers and self.queues:
+                room, queue = self.queues.popitem(last=False)
+                job = queue.popleft()
+                if queue:
+                    # Round-robin: the room goes to the back of the line after each job.
+                    self.queues[room] = queue
+                self.pending -= 1
+                if job.future.cancelled():
+                    continue
+                self.in_flight += 1
+                self.total_wait += time.monotonic() - job.queued_at
+                executor = self.executor
+                try:
+                    running = loop.run_in_executor(executor, JOB_FUNCTIONS[job.kind], *job.args)
+                except Exception as exc:
+                    logger.exception("Could not start %s job for room %s", job.kind, job.room)
+                    self.in_flight -= 1
+                    self.failed += 1
+                    if not job.future.done():
+                        job.future.set_exception(exc)
+                    self._replace_broken_pool(executor, exc)
+                    continue
+                running.add_done_callback(partial(self._finished, job, executor))
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    def _finished(self, job: Job, executor: ProcessPoolExecutor, running: asyncio.Future) -> None:
+        self.in_flight -= 1
+        try:
+            if running.cancelled():
+                self.failed += 1
+                if not job.future.done():
+                    job.future.cancel()
+            elif running.exception() is not None:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(running.exception())
+                self._replace_broken_pool(executor, running.exception())
+            else:
+                self.completed += 1
+                if not job.future.done():
+                    job.future.set_result(running.result())
+        except Exception:
+            logger.exception("Could not finish %s job for room %s", job.kind, job.room)
+        finally:
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def _replace_broken_pool(self, executor: Optional[ProcessPoolExecutor], exc: BaseException) -> None:
+        # Every job of a broken pool fails with BrokenProcessPool; only the first one
+        # to report it, while the pool is still current, starts the new one
+        if not isinstance(exc, BrokenProcessPool) or executor is not self.executor or executor is None:
+            return
+        logger.error("Analysis worker died; starting a new pool")
+        executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = self._new_pool()
+        self.pool_restarts += 1
@@ -0,0 +1,220 @@
+import asyncio
+import base64
+import json
+import os
+import secrets
+import socket
+from typing import Dict, Iterable, Optional, Set, Union
+
+from fastapi import WebSocketDisconnect
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # optional: only the shared registry needs it
+    redis = None
+
+# Identifies this server process in room ownership records
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+# Ownership claims expire unless refreshed, so rooms of a crashed worker do not linger
+CLAIM_TTL = 90
+KEY_PREFIX = "pychess:"
+
+
+class Subscription:
+    def __init__(self, bus: "RoomBus", channel: str):
+        self.bus = bus
+        self.channel = channel
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue()
+
+    async def get(self) -> str:
+        return await self.queue.get()
+
+    async def close(self) -> None:
+        await self.bus.unsubscribe(self)
+
+
+# Room registry and message bus. This in-memory version is the default and only sees
+# the rooms of its own process; RedisBus shares both across processes and nodes.
+class RoomBus:
+    def __init__(self):
+        self.owners: Dict[str, str] = {}
+        self.channels: Dict[str, Set[Subscription]] = {}
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def claim(self, code: str) -> bool:
+        if code in self.owners:
+            return False
+        self.owners[code] = WORKER_ID
+        return True
+
+    async def refresh(self, codes: Iterable[str]) -> None:
+        pass
+
+    async def owner(self, code: str) -> Optional[str]:
+        return self.owners.get(code)
+
+    async def release(self, code: str) -> None:
+        self.owners.pop(code, None)
+
+    async def publish(self, channel: str, text: str) -> None:
+        self.deliver(channel, text)
+
+    async def subscribe(self, channel: str) -> Subscription:
+        sub = Subscription(self, channel)
+        self.channels.setdefault(channel, set()).add(sub)
+        return sub
+
+    async def unsubscribe(self, sub: Subscription) -> bool:
+        # True when that was the last local subscriber of the channel
+        subs = self.channels.get(sub.channel)
+        if subs is None:
+            return False
+        subs.discard(sub)
+        if subs:
+            return False
+        del self.channels[sub.channel]
+        return True
+
+    def deliver(self, channel: str, text: str) -> None:
+        for sub in self.channels.get(channel, ()):
+            sub.queue.put_nowait(text)
+
+
+# Shared registry on Redis: ownership claims are keys set with NX and a TTL, and
+# channels are Redis pub/sub channels read by one listener task per process.
+class RedisBus(RoomBus):
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+        self.pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self.pubsub = self.client.pubsub()
+        # Always subscribed to something, so the listener has a live connection to read
+        await self.pubsub.subscribe(KEY_PREFIX + "worker:" + WORKER_ID)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+            self.pubsub = None
+        await self.client.aclose()
+
+    async def claim(self, code: str) -> bool:
+        return bool(await self.client.set(KEY_PREFIX + "owner:" + code, WORKER_ID, nx=True, ex=CLAIM_TTL))
+
+    async def refresh(self, codes: Iterable[str]) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        for code in codes:
+            pipe.expire(KEY_PREFIX + "owner:" + code, CLAIM_TTL)
+        await pipe.execute()
+
+    async def owner(self, code: str) -> Optional[str]:
+        value = await self.client.get(KEY_PREFIX + "owner:" + code)
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def release(self, code: str) -> None:
+        if await self.owner(code) == WORKER_ID:
+            await self.client.delete(KEY_PREFIX + "owner:" + code)
+
+    async def publish(self, channel: str, text: str) -> None:
+        await self.client.publish(KEY_PREFIX + channel, text)
+
+    async def subscribe(self, channel: str) -> Subscription:
+        first = channel not in self.channels
+        sub = await super().subscribe(channel)
+        if first:
+            await self.pubsub.subscribe(KEY_PREFIX + channel)
+        return sub
+
+    async def unsubscribe(self, sub: Subscription) -> bool:
+        last = await super().unsubscribe(sub)
+        if last and self.pubsub is not None:
+            await self.pubsub.unsubscribe(KEY_PREFIX + sub.channel)
+        return last
+
+    async def _listen(self) -> None:
+        async for message in self.pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            channel = message["channel"]
+            data = message["data"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            if isinstance(data, bytes):
+                data = data.decode()
+            self.deliver(channel[len(KEY_PREFIX):], data)
+
+
+def make_bus(url: str) -> RoomBus:
+    if not url or url.startswith("memory://"):
+        return RoomBus()
+    if url.startswith("fakeredis://"):
+        # Single-process stand-in for trying the shared code path without a Redis server
+        import fakeredis
+        return RedisBus(fakeredis.FakeAsyncRedis())
+    if redis is None:
+        raise RuntimeError("ROOM_BUS_URL needs the redis package. Run: pip install redis")
+    return RedisBus(redis.from_url(url))
+
+
+def wrap_frame(frame: Union[str, bytes], **fields) -> str:
+    # Bus envelopes are JSON; binary frames ride along base64-encoded
+    if isinstance(frame, bytes):
+        fields["bytes"] = base64.b64encode(frame).decode()
+    else:
+        fields["text"] = frame
+    return json.dumps(fields)
+
+
+def unwrap_frame(envelope: dict) -> Optional[Union[str, bytes]]:
+    if "bytes" in envelope:
+        return base64.b64decode(envelope["bytes"])
+    return envelope.get("text")
+
+
+# Stands in for a WebSocket connected to another worker. The room owner runs the normal
+# connection handler on it; frames travel over the bus in both directions.
+class RemotePeer:
+    def __init__(self, bus: RoomBus, conn: str):
+        self.bus = bus
+        self.conn = conn
+        self.inbox: "asyncio.Queue[Optional[Union[str, bytes]]]" = asyncio.Queue()
+
+    async def accept(self) -> None:
+        pass
+
+    async def receive(self) -> dict:
+        frame = await self.inbox.get()
+        if frame is None:
+            return {"type": "websocket.disconnect", "code": 1000}
+        if isinstance(frame, bytes):
+            return {"type": "websocket.receive", "bytes": frame}
+        return {"type": "websocket.receive", "text": frame}
+
+    async def receive_text(self) -> str:
+        message = await self.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message["code"])
+        return message.get("text") or ""
+
+    async def send_text(self, text: str) -> None:
+        await self.bus.publish("conn:" + self.conn, wrap_frame(text))
+
+    async def send_bytes(self, data: bytes) -> None:
+        await self.bus.publish("conn:" + self.conn, wrap_frame(data))
+
+    async def send_json(self, data: dict) -> None:
+        await self.send_text(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+    async def close(self, code: int = 1000) -> None:
+        await self.bus.publish("conn:" + self.conn, json.dumps({"close": code}))
@@ -1,15 +1,28 @@
 import asyncio
 import json
+import logging
+import os
 import secrets
 import string
+import time
+from collections import deque
 from dataclasses import dataclass, field
-from typing import Dict, Optional
+from typing import Deque, Dict, List, Optional, Set, Tuple, Union
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from engine import GameState, Move
+from server.analysis import AnalysisBusy, AnalysisService
+from server.registry import CLAIM_TTL, WORKER_ID, RemotePeer, Subscription, make_bus, unwrap_frame, wrap_frame
+from server.store import make_store
+from wire import move_code, pack_message, unpack_message
+
+# A frame as sent on the socket: JSON text, or bytes for connections using the binary format
+Frame = Union[str, bytes]
+
+logger = logging.getLogger(__name__)
 
 
 def gen_code(length: int = 6) -> str:
@@ -24,32 +37,460 @@ class Room:
     black: Optional[WebSocket] = None
     lock: asyncio.Lock = field(default_factory=asyncio.Lock)
     gs: GameState = field(default_factory=GameState)
+    # Legal moves of the current position by 16-bit move code, and their targets by start
+    # square; None until first needed after each make/undo/reset
+    legal_moves: Optional[Dict[int, Move]] = None
+    targets: Dict[Tuple[int, int], List[List[int]]] = field(default_factory=dict)
+    # Bumped on every state change; clients use it to spot missed deltas
+    seq: int = 0
+    # Read-only viewers, each fed through its own bounded outbox
+    spectators: Dict[WebSocket, "asyncio.Queue[Frame]"] = field(default_factory=dict)
+    # Connections that negotiated the compact binary format
+    binary: Set[WebSocket] = field(default_factory=set)
+    # Serves connections that reached this room through another worker
+    relay: Optional[asyncio.Task] = None
+    # Last time a player sent anything; idle rooms are reaped
+    last_active: float = field(default_factory=time.monotonic)
+    # Session token per color, so a dropped player can resume their seat
+    tokens: Dict[str, str] = field(default_factory=dict)
+    # A dropped player's seat stays reserved for them until this time
+    reserved_until: Dict[str, float] = field(default_factory=dict)
+    # Recent broadcasts as (seq, message), replayed to a resuming player
+    backlog: Deque[Tuple[int, dict]] = field(default_factory=lambda: deque(maxlen=RESUME_BACKLOG))
+    # Closes the room once the grace period of its last dropped player runs out
+    expiry: Optional[asyncio.Task] = None
 
     def other(self, color: str) -> Optional[WebSocket]:
         return self.black if color == "w" else self.white
 
-    def set_player(self, color: str, ws: WebSocket) -> None:
+    def set_player(self, color: str, ws: Optional[WebSocket]) -> None:
         if color == "w":
             self.white = ws
         else:
             self.black = ws
 
+    def seat(self, color: str) -> Optional[WebSocket]:
+        return self.white if color == "w" else self.black
+
+    def seat_free(self, color: str) -> bool:
+        return self.seat(color) is None and self.reserved_until.get(color, 0.0) <= time.monotonic()
+
+    def issue_token(self, color: str, token: Optional[str] = None) -> str:
+        # Seats a player: a new token for join/create, the same one again on resume
+        self.tokens[color] = token or secrets.token_urlsafe(16)
+        self.reserved_until.pop(color, None)
+        if self.expiry is not None:
+            self.expiry.cancel()
+            self.expiry = None
+        return self.tokens[color]
+
+    def missed_since(self, seq: int) -> Optional[List[dict]]:
+        # Broadcasts after seq, or None when the backlog no longer reaches back that far
+        if seq >= self.seq:
+            return []
+        missed = [message for message_seq, message in self.backlog if message_seq > seq]
+        return missed if len(missed) == self.seq - seq else None
+
+    def peers(self) -> List[WebSocket]:
+        return [ws for ws in (self.white, self.black) if ws is not None]
+
     def player_count(self) -> int:
         return int(self.white is not None) + int(self.black is not None)
 
+    def add_spectator(self, ws: WebSocket) -> "asyncio.Queue[Frame]":
+        outbox: "asyncio.Queue[Frame]" = asyncio.Queue(maxsize=SPECTATOR_QUEUE)
+        self.spectators[ws] = outbox
+        return outbox
+
+    def frame_for(self, ws: WebSocket, text: str, data: Optional[bytes]) -> Frame:
+        return data if data is not None and ws in self.binary else text
+
+    def publish(self, text: str, data: Optional[bytes] = None) -> List[WebSocket]:
+        # Never waits: a viewer whose outbox is full is returned for eviction
+        lagging = []
+        for ws, outbox in self.spectators.items():
+            try:
+                outbox.put_nowait(self.frame_for(ws, text, data))
+            except asyncio.QueueFull:
+                lagging.append(ws)
+        for ws in lagging:
+            del self.spectators[ws]
+            self.binary.discard(ws)
+        return lagging
+
+    def set_legal_moves(self, moves: List[Move]) -> None:
+        self.legal_moves = {}
+        self.targets = {}
+        for mv in moves:
+            code = mv.to_code()
+            self.legal_moves[code] = mv
+            # Each promotion has its own code; list the target square once, with the queen
+            if code < 1 << 12:
+                self.targets.setdefault((mv.start_row, mv.start_col), []).append([mv.end_row, mv.end_col])
+
+    def invalidate_moves(self) -> None:
+        self.legal_moves = None
+        self.targets = {}
+
+
+def touched_squares(move: Move) -> List[Tuple[int, int]]:
+    squares = [(move.start_row, move.start_col), (move.end_row, move.end_col)]
+    if move.is_enpassant_move:
+        squares.append((move.start_row, move.end_col))
+    elif move.is_castle_move:
+        if move.end_col - move.start_col == 2:
+            squares += [(move.end_row, move.end_col + 1), (move.end_row, move.end_col - 1)]
+        else:
+            squares += [(move.end_row, move.end_col - 2), (move.end_row, move.end_col + 1)]
+    return squares
+
+
+def snapshot_message(room: Room) -> dict:
+    return {
+        "type": "state",
+        "code": room.code,
+        "seq": room.seq,
+        "board": [row[:] for row in room.gs.board],
+        "white_to_move": room.gs.white_to_move,
+        "fen": room.gs.to_fen(),
+    }
+
+
+def delta_message(room: Room, move: Move, undo: bool = False) -> dict:
+    # Only the squares the move (or its undo) touched, read back after the board changed
+    board = room.gs.board
+    return {
+        "type": "delta",
+        "seq": room.seq,
+        "move": {
+            "from": [move.start_row, move.start_col],
+            "to": [move.end_row, move.end_col],
+            "promotion": move.promotion_choice if move.is_pawn_promotion else None,
+        },
+        "undo": undo,
+        "changes": [[r, c, board[r][c]] for r, c in touched_squares(move)],
+        "white_to_move": room.gs.white_to_move,
+    }
+
+
+def parse_square(value) -> Optional[Tuple[int, int]]:
+    try:
+        row, col = int(value[0]), int(value[1])
+    except (IndexError, TypeError, ValueError):
+        return None
+    if 0 <= row < 8 and 0 <= col < 8:
+        return row, col
+    return None
+
 
 app = FastAPI(title="PyChess Multiplayer Server")
 
+# Rooms owned by this process; other workers reach them through the bus
 rooms: Dict[str, Room] = {}
+bus = make_bus(os.environ.get("ROOM_BUS_URL", "memory://"))
+# Optional on-disk journal so rooms survive restarts and redeploys
+store = make_store(os.environ.get("JOURNAL_DIR"))
+
+# A peer that cannot take a broadcast within this many seconds is disconnected
+SEND_TIMEOUT = float(os.environ.get("SEND_TIMEOUT", "2.0"))
+evicted_peers = 0
+# Messages a spectator may have waiting before it is dropped
+SPECTATOR_QUEUE = int(os.environ.get("SPECTATOR_QUEUE", "64"))
+
+# Room lifecycle bounds: idle rooms are closed by a periodic reaper, a room still waiting
+# for its second player expires sooner, and each game keeps only its recent moves for undo
+ROOM_IDLE_TIMEOUT = float(os.environ.get("ROOM_IDLE_TIMEOUT", "1800"))
+ROOM_WAITING_TIMEOUT = float(os.environ.get("ROOM_WAITING_TIMEOUT", "600"))
+REAP_INTERVAL = float(os.environ.get("REAP_INTERVAL", "60"))
+MAX_ROOMS = int(os.environ.get("MAX_ROOMS", "10000"))
+ROOM_HISTORY = int(os.environ.get("ROOM_HISTORY", "512"))
+reclaimed = {"idle_rooms": 0, "rejected_rooms": 0, "trimmed_moves": 0}
+
+# Liveness: the server pings every connection and drops one that stays silent; a
+# dropped player can resume with their token within the grace period
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", "15"))
+HEARTBEAT_TIMEOUT = float(os.environ.get("HEARTBEAT_TIMEOUT", "45"))
+RESUME_GRACE = float(os.environ.get("RESUME_GRACE", "60"))
+RESUME_BACKLOG = int(os.environ.get("RESUME_BACKLOG", "64"))
+
+# CPU-heavy chess work (move validation, engine search, perft) runs on a process pool
+analysis = AnalysisService(workers=int(os.environ.get("ANALYSIS_WORKERS", "0")) or None)
+
+
+@app.on_event("startup")
+async def start_analysis():
+    await analysis.start()
+
+
+@app.on_event("shutdown")
+async def stop_analysis():
+    await analysis.stop()
+
+
+@app.on_event("startup")
+async def start_bus():
+    await bus.start()
+    for code, (gs, seq, tokens) in store.load().items():
+        await open_room(gs, code, seq, tokens)
+    await store.start(lambda: {code: (room.gs.to_fen(), room.seq, dict(room.tokens)) for code, room in rooms.items()})
+    app.state.claim_refresher = asyncio.create_task(refresh_claims())
+    app.state.reaper = asyncio.create_task(reap_rooms())
+
+
+@app.on_event("shutdown")
+async def stop_bus():
+    app.state.claim_refresher.cancel()
+    app.state.reaper.cancel()
+    # Snapshot first: rooms closed by the shutdown itself must come back on restart
+    await store.stop()
+    for room in list(rooms.values()):
+        await close_room(room, forget=False)
+    await bus.stop()
+
+
+async def refresh_claims() -> None:
+    while True:
+        await asyncio.sleep(CLAIM_TTL / 3)
+        try:
+            await bus.refresh(list(rooms))
+        except Exception:
+            pass
+
+
+async def reap_rooms() -> None:
+    while True:
+        await asyncio.sleep(REAP_INTERVAL)
+        now = time.monotonic()
+        for room in list(rooms.values()):
+            timeout = ROOM_IDLE_TIMEOUT if room.player_count() == 2 else ROOM_WAITING_TIMEOUT
+            if now - room.last_active > timeout:
+                # One room failing to close must not stop the reaper for good
+                try:
+                    await reap_room(room)
+                except Exception:
+                    logger.exception("Could not reap room %s", room.code)
+
+
+async def reap_room(room: Room) -> None:
+    # Closing the sockets lets each handler run its usual cleanup
+    reclaimed["idle_rooms"] += 1
+    await broadcast(room, {"type": "room_closed", "reason": "idle"})
+    for ws in room.peers():
+        asyncio.create_task(close_quietly(ws))
+    dismiss_viewers(room)
+    await close_room(room)
+
+
+async def expire_room(room: Room) -> None:
+    await asyncio.sleep(RESUME_GRACE)
+    # The reaper may have closed it already
+    if rooms.get(room.code) is room and room.player_count() == 0:
+        room.publish(encode({"type": "room_closed"}))
+        dismiss_viewers(room)
+        await close_room(room)
+
+
+def dismiss_viewers(room: Room) -> None:
+    for ws, outbox in list(room.spectators.items()):
+        asyncio.create_task(close_viewer(ws, outbox))
+
+
+async def close_viewer(ws: WebSocket, outbox: "asyncio.Queue[Frame]") -> None:
+    # Let the writer flush what is queued, such as the room_closed notice, then close
+    try:
+        await asyncio.wait_for(outbox.join(), SEND_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+    await close_quietly(ws)
+
+
+async def open_room(gs: GameState, code: Optional[str] = None, seq: int = 0,
+                    tokens: Optional[Dict[str, str]] = None) -> Optional[Room]:
+    # Room codes are unique across every worker sharing the bus; a restored room keeps
+    # its code, seq and session tokens unless another worker took it in the meantime
+    if code is not None:
+        if code in rooms or not await bus.claim(code):
+            return None
+    else:
+        while True:
+            code = gen_code()
+            if code not in rooms and await bus.claim(code):
+                break
+        store.record(code, "create", fen=gs.to_fen(), seq=0)
+    room = Room(code=code, gs=gs, seq=seq)
+    if tokens:
+        # Players of a restored room get the usual grace period to resume their seats
+        room.tokens.update(tokens)
+        for color in tokens:
+            room.reserved_until[color] = time.monotonic() + RESUME_GRACE
+    rooms[code] = room
+    room.relay = asyncio.create_task(serve_remote(room, await bus.subscribe("room:" + code)))
+    return room
+
+
+async def close_room(room: Room, forget: bool = True) -> None:
+    if rooms.pop(room.code, None) is not None and forget:
+        store.record(room.code, "close")
+    if room.relay is not None:
+        room.relay.cancel()
+        room.relay = None
+    await bus.release(room.code)
+
+
+async def serve_remote(room: Room, sub: Subscription) -> None:
+    # Frames from sockets on other workers arrive on the room channel, tagged with a
+    # connection id; each connection gets the normal handler on a RemotePeer
+    peers: Dict[str, RemotePeer] = {}
+    try:
+        while True:
+            envelope = json.loads(await sub.get())
+            conn = envelope["conn"]
+            peer = peers.get(conn)
+            frame = unwrap_frame(envelope)
+            if frame is not None:
+                if peer is None:
+                    peer = peers[conn] = RemotePeer(bus, conn)
+                    task = asyncio.create_task(websocket_endpoint(peer))
+                    task.add_done_callback(lambda _task, conn=conn: peers.pop(conn, None))
+                peer.inbox.put_nowait(frame)
+            elif peer is not None:
+                peer.inbox.put_nowait(None)
+    finally:
+        for peer in peers.values():
+            peer.inbox.put_nowait(None)
+        await sub.close()
+
+
+async def proxy_remote(ws: WebSocket, code: str, first: str) -> None:
+    # The room lives on another worker: only carry frames between the socket and the bus
+    conn = secrets.token_hex(8)
+    sub = await bus.subscribe("conn:" + conn)
+
+    async def downstream() -> None:
+        while True:
+            envelope = json.loads(await sub.get())
+            if "close" in envelope:
+                await ws.close(code=envelope["close"])
+                return
+            frame = unwrap_frame(envelope)
+            if isinstance(frame, bytes):
+                await ws.send_bytes(frame)
+            else:
+                await ws.send_text(frame)
+
+    pump = asyncio.create_task(downstream())
+    try:
+        await bus.publish("room:" + code, wrap_frame(first, conn=conn))
+        while True:
+            receive = asyncio.ensure_future(receive_frame(ws))
+            await asyncio.wait({receive, pump}, return_when=asyncio.FIRST_COMPLETED)
+            if not receive.done():
+                receive.cancel()
+                break
+            await bus.publish("room:" + code, wrap_frame(receive.result(), conn=conn))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        pump.cancel()
+        try:
+            await bus.publish("room:" + code, json.dumps({"conn": conn, "closed": True}))
+        finally:
+            await sub.close()
+
+
+async def legal_move_index(room: Room, owner: WebSocket) -> Dict[int, Move]:
+    # Caller holds room.lock, so the position cannot change while the pool works
+    if room.legal_moves is None:
+        room.set_legal_moves(await analysis.run(room.code, owner, "validate", room.gs.to_fen()))
+    return room.legal_moves
+
+
+def encode(message: dict) -> str:
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+async def send_encoded(ws: WebSocket, frame: Frame) -> bool:
+    try:
+        if isinstance(frame, bytes):
+            await asyncio.wait_for(ws.send_bytes(frame), SEND_TIMEOUT)
+        else:
+            await asyncio.wait_for(ws.send_text(frame), SEND_TIMEOUT)
+        return True
+    except Exception:
+        return False
+
+
+def encode_for(room: Room, ws: WebSocket, message: dict) -> Frame:
+    data = pack_message(message) if ws in room.binary else None
+    return data if data is not None else encode(message)
+
+
+async def send_message(room: Room, ws: WebSocket, message: dict) -> None:
+    frame = encode_for(room, ws, message)
+    if isinstance(frame, bytes):
+        await ws.send_bytes(frame)
+    else:
+        await ws.send_text(frame)
+
+
+async def receive_frame(ws: WebSocket) -> Frame:
+    message = await ws.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    text = message.get("text")
+    return text if text is not None else message.get("bytes") or b""
+
+
+async def close_quietly(ws: WebSocket) -> None:
+    try:
+        await asyncio.wait_for(ws.close(code=1008), SEND_TIMEOUT)
+    except Exception:
+        pass
+
+
+async def broadcast(room: Room, message: dict) -> None:
+    # Encode once, send to every peer at the same time; a send that times out or fails
+    # leaves that socket in an unknown state, so it is closed and its handler cleans up
+    global evicted_peers
+    peers = room.peers()
+    if not peers and not room.spectators:
+        return
+    text = encode(message)
+    data = pack_message(message) if room.binary else None
+    # Spectators are only queued to here, so they cannot slow down the players
+    for ws in room.publish(text, data):
+        evicted_peers += 1
+        asyncio.create_task(close_quietly(ws))
+    results = await asyncio.gather(*(send_encoded(peer, room.frame_for(peer, text, data)) for peer in peers))
+    for peer, ok in zip(peers, results):
+        if not ok:
+            evicted_peers += 1
+            asyncio.create_task(close_quietly(peer))
+
+
+async def spectator_writer(ws: WebSocket, outbox: "asyncio.Queue[Frame]") -> None:
+    while True:
+        frame = await outbox.get()
+        sent = await send_encoded(ws, frame)
+        outbox.task_done()
+        if not sent:
+            await close_quietly(ws)
+            return
 
 
 @app.get("/health")
 def health():
-    return {"ok": True, "message": "PyChess Multiplayer Server running", "rooms": len(rooms)}
-
-# Static web client and images
-app.mount("/images", StaticFiles(directory="images"), name="images")
-app.mount("/", StaticFiles(directory="web", html=True), name="web")
+    return {
+        "ok": True,
+        "message": "PyChess Multiplayer Server running",
+        "worker": WORKER_ID,
+        "rooms": len(rooms),
+        "spectators": sum(len(room.spectators) for room in rooms.values()),
+        "evicted_peers": evicted_peers,
+        "reclaimed": reclaimed,
+        "store": store.metrics(),
+        "analysis": analysis.metrics(),
+    }
 
 
 @app.websocket("/ws")
@@ -58,53 +499,99 @@ async def websocket_endpoint(ws: WebSocket):
 
     color: Optional[str] = None
     room: Optional[Room] = None
+    writer: Optional[asyncio.Task] = None
+    heartbeat: Optional[asyncio.Task] = None
+    last_seen = time.monotonic()
+    handler = asyncio.current_task()
+    dropped = False
+
+    async def drop() -> None:
+        # A dead peer never completes the close handshake, so the pending receive is
+        # cancelled as well; the normal cleanup then frees the seat and keeps it reserved
+        nonlocal dropped
+        dropped = True
+        await close_quietly(ws)
+        handler.cancel()
+
+    async def heartbeat_loop() -> None:
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if time.monotonic() - last_seen > HEARTBEAT_TIMEOUT:
+                await drop()
+                return
+            ping = encode({"type": "ping"})
+            outbox = room.spectators.get(ws)
+            if outbox is not None:
+                if not outbox.full():
+                    outbox.put_nowait(ping)
+            elif not await send_encoded(ws, ping):
+                await drop()
+                return
 
     try:
         # First message must be an action: create or join
         raw = await ws.receive_text()
         data = json.loads(raw)
         action = data.get("action")
+        # Optional compact frames for state and deltas; anything else keeps JSON
+        encoding = "binary" if data.get("encoding") == "binary" else "json"
 
         if action == "create":
-            # Create a new room and assign white by default
-            code = gen_code()
-            room = Room(code=code)
-            rooms[code] = room
+            # Create a new room and assign white by default, optionally from a FEN position
+            fen = data.get("fen")
+            try:
+                gs = GameState.from_fen(str(fen)) if fen else GameState()
+            except ValueError as exc:
+                await ws.send_json({"type": "error", "message": str(exc)})
+                await ws.close()
+                return
+            if len(rooms) >= MAX_ROOMS:
+                reclaimed["rejected_rooms"] += 1
+                await ws.send_json({"type": "error", "message": "Server full, try again later"})
+                await ws.close()
+                return
+            room = await open_room(gs)
+            code = room.code
             color = "w"
             room.set_player(color, ws)
-            await ws.send_json({"type": "created", "code": code, "color": color})
+            token = room.issue_token(color)
+            store.record(code, "seat", color=color, token=token)
+            if encoding == "binary":
+                room.binary.add(ws)
+            await ws.send_json({"type": "created", "code": code, "color": color, "encoding": encoding,
+                                "token": token})
             # Send initial state
-            await ws.send_json({
-                "type": "state",
-                "code": code,
-                "board": room.gs.board,
-                "white_to_move": room.gs.white_to_move,
-            })
+            await send_message(room, ws, snapshot_message(room))
         elif action == "join":
             code = str(data.get("code", "")).upper()
             room = rooms.get(code)
+            if not room and await bus.owner(code):
+                await proxy_remote(ws, code, raw)
+                return
             if not room:
                 await ws.send_json({"type": "error", "message": "Invalid code"})
                 await ws.close()
                 return
-            # Try to take black if free, else white if free
-            if room.black is None:
+            # Try to take black if free, else white if free; a dropped player's seat is
+            # held for them during the resume grace period
+            if room.seat_free("b"):
                 color = "b"
-            elif room.white is None:
+            elif room.seat_free("w"):
                 color = "w"
             else:
                 await ws.send_json({"type": "error", "message": "Room full"})
                 await ws.close()
                 return
             room.set_player(color, ws)
-            await ws.send_json({"type": "joined", "code": code, "color": color})
+            token = room.issue_token(color)
+            store.record(code, "seat", color=color, token=token)
+            room.last_active = time.monotonic()
+            if encoding == "binary":
+                room.binary.add(ws)
+            await ws.send_json({"type": "joined", "code": code, "color": color, "encoding": encoding,
+                                "token": token})
             # Send current state to the joiner
-            await ws.send_json({
-                "type": "state",
-                "code": code,
-                "board": room.gs.board,
-                "white_to_move": room.gs.white_to_move,
-            })
+            await send_message(room, ws, snapshot_message(room))
             # Notify opponent if present
             opponent = room.other(color)
             if opponent is not None:
@@ -112,24 +599,99 @@ async def websocket_endpoint(ws: WebSocket):
                     await opponent.send_json({"type": "opponent_joined"})
                 except Exception:
                     pass
+        elif action == "resume":
+            code = str(data.get("code", "")).upper()
+            room = rooms.get(code)
+            if not room and await bus.owner(code):
+                await proxy_remote(ws, code, raw)
+                return
+            token = str(data.get("token", ""))
+            seat = None
+            if room:
+                seat = next((c for c, t in room.tokens.items() if secrets.compare_digest(t, token)), None)
+            if seat is None:
+                # The client falls back to a fresh join
+                await ws.send_json({"type": "error", "message": "Session expired"})
+                await ws.close()
+                return
+            color = seat
+            stale = room.seat(color)
+            room.set_player(color, ws)
+            room.issue_token(color, token)
+            room.last_active = time.monotonic()
+            if stale is not None:
+                # The old socket is half-open; it is replaced rather than waited for
+                asyncio.create_task(close_quietly(stale))
+            if encoding == "binary":
+                room.binary.add(ws)
+            await ws.send_json({"type": "resumed", "code": code, "color": color, "encoding": encoding,
+                                "token": token})
+            # Replay only what was missed; fall back to a snapshot past the backlog
+            try:
+                last_seq = int(data.get("seq", -1))
+            except (TypeError, ValueError):
+                last_seq = -1
+            async with room.lock:
+                missed = room.missed_since(last_seq)
+                if missed is None:
+                    missed = [snapshot_message(room)]
+            for message in missed:
+                await send_message(room, ws, message)
+            opponent = room.other(color)
+            if opponent is not None:
+                try:
+                    await opponent.send_json({"type": "opponent_resumed"})
+                except Exception:
+                    pass
+        elif action == "watch":
+            code = str(data.get("code", "")).upper()
+            room = rooms.get(code)
+            if not room and await bus.owner(code):
+                await proxy_remote(ws, code, raw)
+                return
+            if not room:
+                await ws.send_json({"type": "error", "message": "Invalid code"})
+                await ws.close()
+                return
+            if encoding == "binary":
+                room.binary.add(ws)
+            await ws.send_json({"type": "watching", "code": code, "encoding": encoding})
+            # Catch up from a snapshot queued ahead of any later broadcast
+            async with room.lock:
+                outbox = room.add_spectator(ws)
+                outbox.put_nowait(encode_for(room, ws, snapshot_message(room)))
+            writer = asyncio.create_task(spectator_writer(ws, outbox))
         else:
-            await ws.send_json({"type": "error", "message": "First message must be action=create|join"})
+            await ws.send_json({"type": "error",
+                                "message": "First message must be action=create|join|watch|resume"})
             await ws.close()
             return
 
+        heartbeat = asyncio.create_task(heartbeat_loop())
+
         # If both present, signal start to both sides
-        if room and room.white and room.black:
+        if room and color and action != "resume" and room.white and room.black:
             await room.white.send_json({"type": "start", "color": "w", "opponent": "b"})
             await room.black.send_json({"type": "start", "color": "b", "opponent": "w"})
 
         # Main relay loop
         while True:
-            msg = await ws.receive_text()
-            try:
-                payload = json.loads(msg)
-            except json.JSONDecodeError:
-                continue
+            msg = await receive_frame(ws)
+            last_seen = time.monotonic()
+            if isinstance(msg, bytes):
+                payload = unpack_message(msg)
+                if payload is None or payload["type"] != "move":
+                    continue
+            else:
+                try:
+                    payload = json.loads(msg)
+                except json.JSONDecodeError:
+                    continue
             kind = payload.get("type")
+            if kind == "pong":
+                continue
+            if color is not None and kind != "ping":
+                room.last_active = last_seen
             # Relay moves and control messages
             if kind == "move":
                 if room is None or color is None:
@@ -138,95 +700,166 @@ async def websocket_endpoint(ws: WebSocket):
                 m = payload.get("move", {})
                 frm = m.get("from", [0, 0])
                 to = m.get("to", [0, 0])
-                gs = room.gs
-                # Check turn and color
-                turn_color = 'w' if gs.white_to_move else 'b'
-                if color != turn_color:
-                    # Ignore illegal turn
-                    continue
-                try_move = Move((frm[0], frm[1]), (to[0], to[1]), gs.board)
-                legal = None
-                for mv in gs.get_valid_moves():
-                    if mv == try_move:
-                        legal = mv
-                        break
-                if legal is None:
+                start = parse_square(frm)
+                end = parse_square(to)
+                if start is None or end is None:
                     continue
-                gs.make_move(legal)
-                # Backward compatibility: notify opponent raw move
-                other = room.other(color)
-                if other is not None:
+                async with room.lock:
+                    gs = room.gs
+                    # Check turn and color
+                    turn_color = 'w' if gs.white_to_move else 'b'
+                    if color != turn_color:
+                        # Ignore illegal turn
+                        continue
                     try:
-                        await other.send_json({"type": "opponent_move", "move": {"from": frm, "to": to}})
+                        legal_moves = await legal_move_index(room, ws)
+                    except AnalysisBusy:
+                        await ws.send_json({"type": "error", "message": "Server busy, move not played"})
+                        continue
                     except Exception:
-                        pass
-                # Broadcast full state to both players
-                for peer in (room.white, room.black):
-                    if peer is not None:
-                        try:
-                            await peer.send_json({
-                                "type": "state",
-                                "code": room.code,
-                                "board": gs.board,
-                                "white_to_move": gs.white_to_move,
-                            })
-                        except Exception:
-                            pass
+                        logger.exception("Move validation failed in room %s", room.code)
+                        await ws.send_json({"type": "error", "message": "Analysis failed, move not played"})
+                        continue
+                    legal = legal_moves.get(move_code(start, end, m.get("promotion")))
+                    if legal is None:
+                        continue
+                    gs.make_move(legal)
+                    room.invalidate_moves()
+                    room.seq += 1
+                    delta = delta_message(room, legal)
+                    room.backlog.append((room.seq, delta))
+                    store.record(room.code, "move", move=legal.to_code(), seq=room.seq)
+                    reclaimed["trimmed_moves"] += gs.trim_history(ROOM_HISTORY)
+                # Broadcast the changed squares to both players
+                await broadcast(room, delta)
             elif kind == "reset":
-                if room is None:
+                if room is None or color is None:
                     continue
-                room.gs = GameState()
-                for peer in (room.white, room.black):
-                    if peer is not None:
-                        try:
-                            await peer.send_json({
-                                "type": "state",
-                                "code": room.code,
-                                "board": room.gs.board,
-                                "white_to_move": room.gs.white_to_move,
-                            })
-                        except Exception:
-                            pass
+                async with room.lock:
+                    room.gs = GameState()
+                    room.invalidate_moves()
+                    room.seq += 1
+                    store.record(room.code, "reset", seq=room.seq)
+                    snapshot = snapshot_message(room)
+                    room.backlog.append((room.seq, snapshot))
+                await broadcast(room, snapshot)
             elif kind == "undo":
-                if room is None:
+                if room is None or color is None:
                     continue
                 # Undo last move regardless of who requested (simple policy)
-                room.gs.undo_move()
-                for peer in (room.white, room.black):
-                    if peer is not None:
-                        try:
-                            await peer.send_json({
-                                "type": "state",
-                                "code": room.code,
-                                "board": room.gs.board,
-                                "white_to_move": room.gs.white_to_move,
-                            })
-                        except Exception:
-                            pass
+                async with room.lock:
+                    if not room.gs.move_log:
+                        continue
+                    last = room.gs.move_log[-1]
+                    room.gs.undo_move()
+                    room.invalidate_moves()
+                    room.seq += 1
+                    # The position after the undo: a room restored from a snapshot has no move
+                    # history to undo on replay
+                    store.record(room.code, "undo", seq=room.seq, fen=room.gs.to_fen())
+                    delta = delta_message(room, last, undo=True)
+                    room.backlog.append((room.seq, delta))
+                await broadcast(room, delta)
+            elif kind == "resync":
+                if room is None:
+                    continue
+                # Client saw a gap in seq: send a full snapshot
+                async with room.lock:
+                    snapshot = snapshot_message(room)
+                    outbox = room.spectators.get(ws)
+                    if outbox is not None:
+                        # Keep a viewer's messages in order behind its outbox
+                        if not outbox.full():
+                            outbox.put_nowait(encode_for(room, ws, snapshot))
+                        continue
+                await send_message(room, ws, snapshot)
+            elif kind == "hints":
+                if room is None or color is None:
+                    continue
+                # Legal targets from one square, for move highlighting
+                square = parse_square(payload.get("square"))
+                if square is None:
+                    continue
+                async with room.lock:
+                    try:
+                        await legal_move_index(room, ws)
+                    except AnalysisBusy:
+                        await ws.send_json({"type": "error", "message": "Server busy, try again later"})
+                        continue
+                    except Exception:
+                        logger.exception("Move hints failed in room %s", room.code)
+                        await ws.send_json({"type": "error", "message": "Analysis failed, try again later"})
+                        continue
+                    targets = room.targets.get(square, [])
+                await ws.send_json({"type": "hints", "square": list(square), "targets": targets})
+            elif kind == "analyze":
+                if room is None or color is None:
+                    continue
+                # Engine suggestion for the current position, e.g. for a bot opponent
+                try:
+                    time_limit_ms = max(10, int(payload.get("ms", 500)))
+                except (TypeError, ValueError):
+                    continue
+                try:
+                    result = await analysis.run(room.code, ws, "search", room.gs.to_fen(), time_limit_ms)
+                except AnalysisBusy:
+                    await ws.send_json({"type": "error", "message": "Server busy, try again later"})
+                    continue
+                except Exception:
+                    logger.exception("Analysis failed in room %s", room.code)
+                    await ws.send_json({"type": "error", "message": "Analysis failed, try again later"})
+                    continue
+                best = None
+                if result.move is not None:
+                    best = {
+                        "from": [result.move.start_row, result.move.start_col],
+                        "to": [result.move.end_row, result.move.end_col],
+                        "promotion": result.move.promotion_choice if result.move.is_pawn_promotion else None,
+                    }
+                await ws.send_json({
+                    "type": "analysis",
+                    "move": best,
+                    "score": result.score,
+                    "depth": result.depth,
+                    "nodes": result.nodes,
+                })
             elif kind == "ping":
                 await ws.send_json({"type": "pong"})
 
     except WebSocketDisconnect:
         pass
+    except asyncio.CancelledError:
+        if not dropped:
+            raise
     finally:
         # Cleanup on disconnect
+        analysis.cancel(ws)
+        if writer is not None:
+            writer.cancel()
+        if heartbeat is not None:
+            heartbeat.cancel()
+        if room and color is None:
+            room.spectators.pop(ws, None)
+        if room:
+            room.binary.discard(ws)
         if room and color:
             async with room.lock:
                 try:
-                    if color == "w":
-                        room.white = None
-                    else:
-                        room.black = None
-                    # Notify remaining player
-                    other = room.other(color)
-                    if other is not None:
-                        try:
-                            await other.send_json({"type": "opponent_left"})
-                        except Exception:
-                            pass
-                    # Remove empty room
-                    if room.player_count() == 0:
-                        rooms.pop(room.code, None)
+                    # Unless a resumed session already took the seat over, free it but keep
+                    # it reserved for this player's token for a while
+                    if room.seat(color) is ws:
+                        room.set_player(color, None)
+                        room.reserved_until[color] = time.monotonic() + RESUME_GRACE
+                        # Notify remaining player
+                        other = room.other(color)
+                        if other is not None:
+                            try:
+                                await other.send_json({"type": "opponent_left"})
+                            except Exception:
+                                pass
+                        # Close the room once nobody came back, letting its viewers know
+                        if room.player_count() == 0 and room.expiry is None:
+                            room.expiry = asyncio.create_task(expire_room(room))
                 except Exception:
                     pass
 
@@ -241,10 +874,21 @@ def demo_page():
             <p>Web client is served at <a href='/'>/</a>. WebSocket endpoint: <code>/ws</code></p>
             <pre>
 Create: {"action":"create"}
+From:   {"action":"create","fen":"8/8/8/8/8/8/4k3/4K2R w K - 0 1"}
 Join:   {"action":"join","code":"ABC123"}
+Watch:  {"action":"watch","code":"ABC123"}
+Resume: {"action":"resume","code":"ABC123","token":"...","seq":12}
 Move:   {"type":"move","move":{"from":[6,4],"to":[4,4]}}
+Hints:  {"type":"hints","square":[6,4]}
+Resync: {"type":"resync"}
+Engine: {"type":"analyze","ms":500}
             </pre>
           </body>
         </html>
         """
     )
+
+
+# Static web client and images; mounted last so the catch-all "/" does not shadow /ws
+app.mount("/images", StaticFiles(directory="images"), name="images")
+app.mount("/", StaticFiles(directory="web", html=True), name="web")
@@ -0,0 +1,310 @@
+import asyncio
+import fcntl
+import itertools
+import json
+import logging
+import os
+import time
+from typing import IO, Callable, Dict, List, Optional, Tuple
+
+from engine import GameState
+
+# Rooms rebuilt from disk: code -> (position, seq, session token per color)
+Restored = Dict[str, Tuple[GameState, int, Dict[str, str]]]
+# Current rooms as code -> (FEN, seq, tokens), asked for when a snapshot is due
+SnapshotSource = Callable[[], Dict[str, Tuple[str, int, Dict[str, str]]]]
+
+logger = logging.getLogger(__name__)
+
+# Wait before writing again after the disk refused a write
+RETRY_SECONDS = 1.0
+
+
+# No persistence: the default when JOURNAL_DIR is not set.
+class NullStore:
+    async def start(self, snapshot_source: SnapshotSource) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def load(self) -> Restored:
+        return {}
+
+    def record(self, code: str, event: str, **fields) -> None:
+        pass
+
+    def metrics(self) -> dict:
+        return {"backend": "memory"}
+
+
+# Append-only journal of room events in numbered flat files, with periodic snapshots.
+# Events are buffered and written by one flusher task, so a burst of moves costs a
+# single write and fsync. A snapshot stores every room as FEN plus seq and starts a new
+# journal generation; older journals are then deleted, so startup only replays the
+# events since the last snapshot.
+# Workers sharing the directory each hold a slot (an flock on slot.N.lock, released
+# when the process dies) and only touch that slot's files; a restarted worker takes a
+# free slot over and restores its rooms. A room that cannot be restored is logged and
+# left out, so one bad entry does not stop the server from starting. A failed write
+# keeps its events buffered and is retried; until one succeeds the store reports itself
+# degraded.
+class JournalStore(NullStore):
+    def __init__(self, directory: str, flush_ms: float = 50, snapshot_every: int = 10000,
+                 snapshot_interval: float = 300):
+        self.directory = directory
+        self.flush_ms = flush_ms
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval = snapshot_interval
+        self.generation = 0
+        self.buffer: List[str] = []
+        self.events_since_snapshot = 0
+        self.last_snapshot = time.monotonic()
+        self.written = 0
+        self.flushes = 0
+        self.snapshots = 0
+        self.skipped_rooms = 0
+        self.write_errors = 0
+        self.degraded = False
+        self.snapshot_source: Optional[SnapshotSource] = None
+        self.slot: Optional[int] = None
+        self._slot_lock: Optional[IO] = None
+        self._pending: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, f"snapshot.{self.slot}.json")
+
+    def journal_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"journal.{self.slot}.{generation}.log")
+
+    def journal_generations(self) -> List[int]:
+        prefix = f"journal.{self.slot}."
+        generations = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(".log"):
+                try:
+                    generations.append(int(name[len(prefix):-len(".log")]))
+                except ValueError:
+                    pass
+        return sorted(generations)
+
+    def acquire_slot(self) -> None:
+        for slot in itertools.count():
+            lock = open(os.path.join(self.directory, f"slot.{slot}.lock"), "a")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                continue
+            self.slot, self._slot_lock = slot, lock
+            return
+
+    def load(self) -> Restored:
+        os.makedirs(self.directory, exist_ok=True)
+        if self.slot is None:
+            self.acquire_slot()
+        restored: Restored = {}
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path) as f:
+                    snapshot = json.load(f)
+                self.generation = snapshot["generation"]
+                rooms = snapshot["rooms"].items()
+            except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                logger.exception("Unreadable snapshot %s; starting from the journals", self.snapshot_path)
+                rooms = ()
+            for code, entry in rooms:
+                try:
+                    # Snapshots written before seats were journaled have no tokens
+                    tokens = entry[2] if len(entry) > 2 else {}
+                    restored[code] = (GameState.from_fen(entry[0]), entry[1], tokens)
+                except Exception:
+                    logger.exception("Skipping room %s: bad snapshot entry %r", code, entry)
+                    self.skipped_rooms += 1
+        # A crash between starting a journal generation and writing its snapshot leaves
+        # more than one journal newer than the snapshot; replay them all in order
+        for generation in self.journal_generations():
+            if generation < self.generation:
+                continue
+            self.generation = generation
+            with open(self.journal_path(generation)) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # torn final write
+                    try:
+                        replay(restored, entry)
+                    except Exception:
+                        # The room's later events are ignored once it is gone
+                        logger.exception("Skipping room: cannot replay journal entry %r", entry)
+                        code = entry.get("room") if isinstance(entry, dict) else None
+                        if code is not None:
+                            restored.pop(code, None)
+                            self.skipped_rooms += 1
+        return restored
+
+    async def start(self, snapshot_source: SnapshotSource) -> None:
+        self.snapshot_source = snapshot_source
+        self._pending = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        try:
+            await self._flush()
+            await self.snapshot()
+        except OSError:
+            self.write_errors += 1
+            logger.exception("Could not save the journal in %s on shutdown", self.directory)
+        if self._slot_lock is not None:
+            self._slot_lock.close()
+            self._slot_lock, self.slot = None, None
+
+    def record(self, code: str, event: str, **fields) -> None:
+        fields["room"] = code
+        fields["event"] = event
+        self.buffer.append(json.dumps(fields, separators=(",", ":")) + "\n")
+        self.events_since_snapshot += 1
+        if self._pending is not None:
+            self._pending.set()
+
+    def metrics(self) -> dict:
+        return {
+            "backend": "journal",
+            "slot": self.slot,
+            "generation": self.generation,
+            "buffered": len(self.buffer),
+            "written": self.written,
+            "flushes": self.flushes,
+            "snapshots": self.snapshots,
+            "events_since_snapshot": self.events_since_snapshot,
+            "skipped_rooms": self.skipped_rooms,
+            "write_errors": self.write_errors,
+            "degraded": self.degraded,
+        }
+
+    async def snapshot(self) -> None:
+        if self.snapshot_source is None:
+            return
+        # Capture rooms and switch generation in one step, so every later event lands in
+        # the new journal; the old journal is flushed before the snapshot replaces it
+        rooms = self.snapshot_source()
+        old_generation, old_events = self.generation, self._take()
+        self.generation += 1
+        self.events_since_snapshot = 0
+        self.last_snapshot = time.monotonic()
+        try:
+            await asyncio.to_thread(self._write, old_generation, old_events)
+        except OSError:
+            # Without the snapshot the old journal still counts: its missing events go
+            # first into the new one
+            self.buffer[:0] = old_events
+            raise
+        await asyncio.to_thread(self._write_snapshot, self.generation, rooms)
+        self.snapshots += 1
+
+    async def _flush_loop(self) -> None:
+        assert self._pending is not None
+        while True:
+            try:
+                await asyncio.wait_for(self._pending.wait(), self.snapshot_interval)
+            except asyncio.TimeoutError:
+                pass
+            # Let a burst of events collect into one write
+            await asyncio.sleep(self.flush_ms / 1000)
+            self._pending.clear()
+            try:
+                if (self.events_since_snapshot >= self.snapshot_every
+                        or (self.events_since_snapshot and time.monotonic() - self.last_snapshot >= self.snapshot_interval)):
+                    await self.snapshot()
+                else:
+                    await self._flush()
+            except OSError:
+                self.write_errors += 1
+                if not self.degraded:
+                    logger.exception("Journal write failed in %s; retrying", self.directory)
+                self.degraded = True
+                await asyncio.sleep(RETRY_SECONDS)
+                self._pending.set()
+                continue
+            if self.degraded:
+                logger.warning("Journal writes in %s work again", self.directory)
+            self.degraded = False
+
+    async def _flush(self) -> None:
+        lines = self._take()
+        try:
+            await asyncio.to_thread(self._write, self.generation, lines)
+        except OSError:
+            self.buffer[:0] = lines
+            raise
+
+    def _take(self) -> List[str]:
+        lines, self.buffer = self.buffer, []
+        return lines
+
+    def _write(self, generation: int, lines: List[str]) -> None:
+        if not lines:
+            return
+        with open(self.journal_path(generation), "a") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self.written += len(lines)
+        self.flushes += 1
+
+    def _write_snapshot(self, generation: int, rooms: Dict[str, Tuple[str, int, Dict[str, str]]]) -> None:
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"generation": generation, "rooms": rooms}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        for old in self.journal_generations():
+            if old < generation:
+                os.remove(self.journal_path(old))
+
+
+def replay(restored: Restored, entry: dict) -> None:
+    code, event = entry["room"], entry["event"]
+    if event == "create":
+        restored[code] = (GameState.from_fen(entry["fen"]), entry.get("seq", 0), {})
+        return
+    if code not in restored:
+        return
+    gs, seq, tokens = restored[code]
+    if event == "seat":
+        tokens[entry["color"]] = entry["token"]
+        return
+    if event == "move":
+        for move in gs.get_valid_moves():
+            if move.to_code() == entry["move"]:
+                gs.make_move(move)
+                break
+    elif event == "undo":
+        if "fen" in entry:
+            gs = GameState.from_fen(entry["fen"])
+        else:
+            gs.undo_move()
+    elif event == "reset":
+        gs = GameState()
+    elif event == "close":
+        del restored[code]
+        return
+    restored[code] = (gs, entry.get("seq", seq + 1), tokens)
+
+
+def make_store(directory: Optional[str]) -> NullStore:
+    if not directory:
+        return NullStore()
+    return JournalStore(
+        directory,
+        flush_ms=float(os.environ.get("JOURNAL_FLUSH_MS", "50")),
+        snapshot_every=int(os.environ.get("JOURNAL_SNAPSHOT_EVERY", "10000")),
+        snapshot_interval=float(os.environ.get("JOURNAL_SNAPSHOT_INTERVAL", "300")),
+    )
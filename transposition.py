@@ -0,0 +1,95 @@
+from array import array
+
+EXACT, LOWER, UPPER = 0, 1, 2
+BUCKET_SLOTS = 2  # slot 0 keeps the deepest result, slot 1 always takes the newest
+ENTRY_BYTES = 16  # one 64-bit key plus one 64-bit packed entry
+DEFAULT_SIZE_MB = 8
+
+_SCORE_OFFSET = 1 << 21
+_MATE_THRESHOLD = 90000
+
+
+# Fixed-size hash table of search results keyed by Zobrist key. Memory is allocated
+# once from the megabyte budget and never grows. Each entry is packed into one
+# 64-bit integer: move code (16 bits) | bound (2) | depth (8) | age (8) | score (22),
+# with the top bit set so that zero always means an empty slot.
+class TranspositionTable:
+    def __init__(self, size_mb=DEFAULT_SIZE_MB):
+        buckets = max(1, int(size_mb * 1024 * 1024) // (ENTRY_BYTES * BUCKET_SLOTS))
+        # Round down to a power of two so the bucket index is a mask.
+        self.bucket_count = 1 << (buckets.bit_length() - 1)
+        self.mask = self.bucket_count - 1
+        self.keys = array('Q', bytes(8 * self.bucket_count * BUCKET_SLOTS))
+        self.entries = array('Q', bytes(8 * self.bucket_count * BUCKET_SLOTS))
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    @property
+    def size_bytes(self):
+        return self.keys.itemsize * len(self.keys) + self.entries.itemsize * len(self.entries)
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def new_search(self):
+        self.age = (self.age + 1) & 0xFF
+
+    def clear(self):
+        self.keys = array('Q', bytes(8 * len(self.keys)))
+        self.entries = array('Q', bytes(8 * len(self.entries)))
+        self.age = 0
+        self.probes = self.hits = self.stores = self.overwrites = 0
+
+    def probe(self, key, ply=0):
+        self.probes += 1
+        index = (key & self.mask) * BUCKET_SLOTS
+        for slot in (index, index + 1):
+            entry = self.entries[slot]
+            if entry and self.keys[slot] == key:
+                self.hits += 1
+                score = ((entry >> 34) & 0x3FFFFF) - _SCORE_OFFSET
+                # Mate scores are stored relative to the node, not the root.
+                if score > _MATE_THRESHOLD:
+                    score -= ply
+                elif score < -_MATE_THRESHOLD:
+                    score += ply
+                return (entry >> 18) & 0xFF, score, (entry >> 16) & 0x3, entry & 0xFFFF
+        return None
+
+    def store(self, key, depth, score, bound, move_code=0, ply=0):
+        if score > _MATE_THRESHOLD:
+            score += ply
+        elif score < -_MATE_THRESHOLD:
+            score -= ply
+        depth = max(0, min(depth, 0xFF))
+        entry = ((move_code & 0xFFFF) | bound << 16 | depth << 18 | self.age << 26
+                 | (score + _SCORE_OFFSET) << 34 | 1 << 63)
+        index = (key & self.mask) * BUCKET_SLOTS
+        keys = self.keys
+        entries = self.entries
+        self.stores += 1
+        stored = entries[index]
+        if (not stored or keys[index] == key or depth >= (stored >> 18) & 0xFF
+                or (stored >> 26) & 0xFF != self.age):
+            slot = index
+        else:
+            slot = index + 1
+        if entries[slot] and keys[slot] != key:
+            self.overwrites += 1
+        keys[slot] = key
+        entries[slot] = entry
+
+    def stats(self):
+        return {
+            "size_bytes": self.size_bytes,
+            "buckets": self.bucket_count,
+            "probes": self.probes,
+            "hits": self.hits,
+            "hit_rate": round(self.hit_rate, 4),
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+        }
@@ -4,6 +4,10 @@ const state = {
   myColor: null, // 'w' | 'b'
   whiteToMove: true,
   board: [],
+  seq: -1, // last applied server state version
+  binary: false, // server agreed to compact binary frames
+  token: null, // session token for resuming after a dropped connection
+  retries: 0,
   selected: null,
 };
 
@@ -81,33 +85,159 @@ function onSquareClick(e) {
   if (from.r === to.r && from.c === to.c) return;
 
   // Send move; server validates
+  if (state.binary) {
+    state.ws?.send(encodeMove(from, to));
+    return;
+  }
   state.ws?.send(JSON.stringify({
     type: 'move',
     move: { from: [from.r, from.c], to: [to.r, to.c] }
   }));
 }
 
+// Compact binary frames (see wire.py): squares are row * 8 + col, moves are 16-bit codes
+const PIECES = ['--', 'wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK'];
+const FRAME_STATE = 1, FRAME_DELTA = 2, FRAME_MOVE = 3;
+const FLAG_WHITE_TO_MOVE = 1, FLAG_UNDO = 2;
+
+function decodeMoveCode(code) {
+  const from = code & 63, to = (code >> 6) & 63;
+  return { from: [from >> 3, from & 7], to: [to >> 3, to & 7] };
+}
+
+function decodeFrame(buf) {
+  const view = new DataView(buf);
+  const kind = view.getUint8(0);
+  if (kind === FRAME_STATE && buf.byteLength === 43) {
+    const board = [];
+    for (let r = 0; r < 8; r++) {
+      const row = [];
+      for (let c = 0; c < 8; c++) {
+        const sq = r * 8 + c;
+        row.push(PIECES[(view.getUint8(6 + (sq >> 1)) >> (4 * (sq & 1))) & 15]);
+      }
+      board.push(row);
+    }
+    const flags = view.getUint8(5);
+    return { type: 'state', seq: view.getUint32(1), board, white_to_move: !!(flags & FLAG_WHITE_TO_MOVE) };
+  }
+  if (kind === FRAME_DELTA && buf.byteLength >= 9) {
+    const flags = view.getUint8(7);
+    const changes = [];
+    for (let i = 0, off = 9; i < view.getUint8(8); i++, off += 2) {
+      const sq = view.getUint8(off);
+      changes.push([sq >> 3, sq & 7, PIECES[view.getUint8(off + 1)]]);
+    }
+    return {
+      type: 'delta', seq: view.getUint32(1), move: decodeMoveCode(view.getUint16(5)),
+      undo: !!(flags & FLAG_UNDO), changes, white_to_move: !!(flags & FLAG_WHITE_TO_MOVE),
+    };
+  }
+  return null;
+}
+
+function encodeMove(from, to) {
+  const buf = new ArrayBuffer(3);
+  const view = new DataView(buf);
+  view.setUint8(0, FRAME_MOVE);
+  view.setUint16(1, (from.r * 8 + from.c) | ((to.r * 8 + to.c) << 6));
+  return buf;
+}
+
+function saveSession() {
+  sessionStorage.setItem('pychess', JSON.stringify({ code: state.code, token: state.token, seq: state.seq }));
+}
+
+function forgetSession() {
+  state.token = null;
+  sessionStorage.removeItem('pychess');
+}
+
+function reconnect() {
+  // Back off 1s, 2s, 4s... up to 30s between attempts
+  const delay = Math.min(30000, 1000 * 2 ** state.retries);
+  state.retries += 1;
+  setStatus(`Déconnecté, reconnexion dans ${Math.round(delay / 1000)}s`);
+  setTimeout(connect, delay);
+}
+
 function connect() {
   state.ws = new WebSocket(wsUrl());
-  state.ws.addEventListener('open', () => setStatus('Connecté'));
-  state.ws.addEventListener('close', () => setStatus('Déconnecté'));
+  state.ws.binaryType = 'arraybuffer';
+  state.ws.addEventListener('open', () => {
+    setStatus('Connecté');
+    // Take the seat back: the server replays the moves missed since seq
+    const saved = JSON.parse(sessionStorage.getItem('pychess') || 'null');
+    if (saved && saved.token) {
+      state.ws.send(JSON.stringify({ action: 'resume', code: saved.code, token: saved.token, seq: saved.seq, encoding: 'binary' }));
+    }
+  });
+  state.ws.addEventListener('close', () => {
+    if (state.token) reconnect();
+    else setStatus('Déconnecté');
+  });
   state.ws.addEventListener('message', (evt) => {
     let msg;
-    try { msg = JSON.parse(evt.data); } catch { return; }
+    if (evt.data instanceof ArrayBuffer) {
+      msg = decodeFrame(evt.data);
+      if (!msg) return;
+    } else {
+      try { msg = JSON.parse(evt.data); } catch { return; }
+    }
     const t = msg.type;
-    if (t === 'created' || t === 'joined') {
+    if (t === 'ping') {
+      state.ws.send(JSON.stringify({ type: 'pong' }));
+    } else if (t === 'created' || t === 'joined' || t === 'resumed') {
       state.code = msg.code;
+      state.token = msg.token || null;
+      state.retries = 0;
+      // Older servers do not answer the encoding request and keep JSON
+      state.binary = msg.encoding === 'binary';
       // Couleur uniquement connue pour le client courant
       if (msg.color) state.myColor = msg.color;
+      if (t === 'resumed') setStatus('Reconnecté');
+      saveSession();
+      renderBoard();
+    } else if (t === 'watching') {
+      // Spectateur: lecture seule
+      state.code = msg.code;
+      state.binary = msg.encoding === 'binary';
+      state.myColor = null;
+      setStatus('Spectateur');
       renderBoard();
+    } else if (t === 'room_closed') {
+      forgetSession();
+      setStatus('Partie terminée: les joueurs sont partis');
+    } else if (t === 'opponent_left') {
+      setStatus('Adversaire déconnecté, en attente de son retour');
+    } else if (t === 'opponent_resumed') {
+      setStatus('Adversaire reconnecté');
     } else if (t === 'start') {
       // Both connected
     } else if (t === 'state') {
+      // Full snapshot: on join, reset or resync
       state.code = msg.code || state.code;
       state.board = msg.board;
       state.whiteToMove = !!msg.white_to_move;
+      state.seq = msg.seq ?? -1;
+      if (state.token) saveSession();
+      renderBoard();
+    } else if (t === 'delta') {
+      // Already covered by the last snapshot
+      if (msg.seq <= state.seq) return;
+      // Missed an update: ask for a snapshot instead of applying out of order
+      if (msg.seq !== state.seq + 1) {
+        state.ws.send(JSON.stringify({ type: 'resync' }));
+        return;
+      }
+      for (const [r, c, piece] of msg.changes) state.board[r][c] = piece;
+      state.whiteToMove = !!msg.white_to_move;
+      state.seq = msg.seq;
+      if (state.token) saveSession();
       renderBoard();
     } else if (t === 'error') {
+      // The room is gone or the grace period ran out: start over
+      if (msg.message === 'Session expired') forgetSession();
       setStatus(`Erreur: ${msg.message || 'inconnue'}`);
     }
   });
@@ -115,18 +245,26 @@ function connect() {
 
 function host() {
   if (!state.ws || state.ws.readyState !== WebSocket.OPEN) return;
-  state.ws.send(JSON.stringify({ action: 'create' }));
+  state.ws.send(JSON.stringify({ action: 'create', encoding: 'binary' }));
 }
 
 function join() {
   const code = document.getElementById('codeInput').value.trim().toUpperCase();
   if (!code) return;
   if (!state.ws || state.ws.readyState !== WebSocket.OPEN) return;
-  state.ws.send(JSON.stringify({ action: 'join', code }));
+  state.ws.send(JSON.stringify({ action: 'join', code, encoding: 'binary' }));
+}
+
+function watch() {
+  const code = document.getElementById('codeInput').value.trim().toUpperCase();
+  if (!code) return;
+  if (!state.ws || state.ws.readyState !== WebSocket.OPEN) return;
+  state.ws.send(JSON.stringify({ action: 'watch', code, encoding: 'binary' }));
 }
 
 document.getElementById('hostBtn').addEventListener('click', host);
 document.getElementById('joinBtn').addEventListener('click', join);
+document.getElementById('watchBtn').addEventListener('click', watch);
 
 connect();
 renderBoard();
@@ -0,0 +1,126 @@
+import struct
+from typing import Optional
+
+from engine import PROMOTION_CHOICES
+
+# Compact binary frames for the /ws protocol, used by connections that send
+# "encoding": "binary" in their create/join/watch message; everything else stays JSON.
+# Squares are row * 8 + col and moves are 16-bit Move.to_code() values.
+PIECES = ('--', 'wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK')
+PIECE_INDEX = {piece: index for index, piece in enumerate(PIECES)}
+
+# seq u32, flags u8, the board as 32 bytes of 4-bit piece indexes, then the en passant
+# file u8 (NO_EP when none), halfmove clock u16 and fullmove number u16
+FRAME_STATE = 1
+FRAME_DELTA = 2  # seq u32, move u16, flags u8, count u8, then (square u8, piece u8) pairs
+FRAME_MOVE = 3  # client to server: move u16
+
+FLAG_WHITE_TO_MOVE = 1
+FLAG_UNDO = 2
+# State frames keep the castling rights in the high nibble of the flags, in this order
+CASTLING_FLAGS = (('K', 16), ('Q', 32), ('k', 64), ('q', 128))
+NO_EP = 0xFF
+
+_STATE = struct.Struct(">BIB32sBHH")
+_DELTA = struct.Struct(">BIHBB")
+_MOVE = struct.Struct(">BH")
+
+
+def move_code(start, end, promotion=None):
+    index = PROMOTION_CHOICES.index(promotion) if promotion in PROMOTION_CHOICES else 0
+    return (start[0] * 8 + start[1]) | (end[0] * 8 + end[1]) << 6 | index << 12
+
+
+def decode_move_code(code):
+    # Promotion index 0 covers both a queen promotion and an ordinary move
+    start, end, index = code & 63, (code >> 6) & 63, (code >> 12) & 3
+    return {
+        "from": [start >> 3, start & 7],
+        "to": [end >> 3, end & 7],
+        "promotion": PROMOTION_CHOICES[index] if index else None,
+    }
+
+
+def pack_board(board):
+    packed = bytearray(32)
+    for sq in range(64):
+        packed[sq >> 1] |= PIECE_INDEX[board[sq >> 3][sq & 7]] << (4 * (sq & 1))
+    return bytes(packed)
+
+
+def unpack_board(packed):
+    return [[PIECES[(packed[(r * 8 + c) >> 1] >> (4 * (c & 1))) & 15] for c in range(8)] for r in range(8)]
+
+
+def board_placement(board):
+    # FEN piece placement field
+    ranks = []
+    for row in board:
+        rank = ""
+        empty = 0
+        for piece in row:
+            if piece == "--":
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            rank += piece[1] if piece[0] == 'w' else piece[1].lower()
+        ranks.append(rank + (str(empty) if empty else ""))
+    return "/".join(ranks)
+
+
+def pack_message(message) -> Optional[bytes]:
+    # Only the state snapshot and the move delta have a binary form
+    kind = message.get("type")
+    flags = FLAG_WHITE_TO_MOVE if message.get("white_to_move") else 0
+    if kind == "state":
+        # Everything in the FEN besides the board, so the receiver can rebuild it exactly
+        _, _, castling, ep, halfmove, fullmove = message["fen"].split()
+        for letter, bit in CASTLING_FLAGS:
+            if letter in castling:
+                flags |= bit
+        ep_file = NO_EP if ep == '-' else "abcdefgh".index(ep[0])
+        return _STATE.pack(FRAME_STATE, message["seq"], flags, pack_board(message["board"]), ep_file,
+                           int(halfmove), int(fullmove))
+    if kind == "delta":
+        move = message["move"]
+        if message.get("undo"):
+            flags |= FLAG_UNDO
+        changes = message["changes"]
+        header = _DELTA.pack(FRAME_DELTA, message["seq"], move_code(move["from"], move["to"], move.get("promotion")),
+                             flags, len(changes))
+        return header + bytes(b for r, c, piece in changes for b in (r * 8 + c, PIECE_INDEX[piece]))
+    return None
+
+
+def unpack_message(data) -> Optional[dict]:
+    # Inverse of pack_message, giving the same dicts as the JSON protocol
+    if not data:
+        return None
+    kind = data[0]
+    if kind == FRAME_STATE and len(data) == _STATE.size:
+        _, seq, flags, packed, ep_file, halfmove, fullmove = _STATE.unpack(data)
+        board = unpack_board(packed)
+        white_to_move = bool(flags & FLAG_WHITE_TO_MOVE)
+        castling = "".join(letter for letter, bit in CASTLING_FLAGS if flags & bit) or "-"
+        ep = "-" if ep_file == NO_EP else "abcdefgh"[ep_file & 7] + ("6" if white_to_move else "3")
+        fen = " ".join((board_placement(board), "w" if white_to_move else "b", castling, ep,
+                        str(halfmove), str(fullmove)))
+        return {"type": "state", "seq": seq, "board": board, "white_to_move": white_to_move, "fen": fen}
+    if kind == FRAME_DELTA and len(data) >= _DELTA.size:
+        _, seq, code, flags, count = _DELTA.unpack_from(data)
+        body = data[_DELTA.size:]
+        if len(body) != 2 * count:
+            return None
+        changes = [[body[i] >> 3, body[i] & 7, PIECES[body[i + 1]]] for i in range(0, len(body), 2)]
+        return {"type": "delta", "seq": seq, "move": decode_move_code(code), "undo": bool(flags & FLAG_UNDO),
+                "changes": changes, "white_to_move": bool(flags & FLAG_WHITE_TO_MOVE)}
+    if kind == FRAME_MOVE and len(data) == _MOVE.size:
+        _, code = _MOVE.unpack(data)
+        return {"type": "move", "move": decode_move_code(code)}
+    return None
+
+
+def pack_move(start, end, promotion=None):
+    return _MOVE.pack(FRAME_MOVE, move_code(start, end, promotion))